@@ -1,6 +1,9 @@
 from fastapi import HTTPException, status, Depends, Request
+import hashlib
+import hmac
 import secrets
 import time
+from urllib.parse import quote
 from config import settings
 
 # Simple session storage
@@ -53,4 +56,22 @@ async def get_current_user(request: Request):
             detail="Token expired",
         )
     
-    return {"username": user_data.get("username")}
\ No newline at end of file
+    return {"username": user_data.get("username")}
+
+# Signed photo URLs, so <img src> tags can load thumbnails without an Authorization header
+PHOTO_URL_LIFETIME = 24 * 60 * 60
+
+def sign_photo(file_id: str, size: int, expires: int) -> str:
+    message = f"{file_id}:{size}:{expires}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+def signed_photo_url(file_id: str, size: int) -> str:
+    # Expiry is rounded up to a day boundary so the URL (and the browser cache entry) stays stable for a day
+    expires = (int(time.time()) // PHOTO_URL_LIFETIME + 2) * PHOTO_URL_LIFETIME
+    signature = sign_photo(file_id, size, expires)
+    return f"/photos/{quote(file_id, safe='')}?size={size}&expires={expires}&signature={signature}"
+
+def verify_photo_signature(file_id: str, size: int, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_photo(file_id, size, expires), signature)
\ No newline at end of file
@@ -16,5 +16,23 @@ class Settings:
     # Admin Credentials (in production, use proper user management)
     ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
     ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "password123")
+    
+    # Analytics cache configuration (seconds). The TTL bounds how stale
+    # demographics can be after the bot edits existing users
+    DEMOGRAPHICS_CACHE_TTL = int(os.getenv("DEMOGRAPHICS_CACHE_TTL", "600"))
+    DEMOGRAPHICS_CACHE_SIZE = int(os.getenv("DEMOGRAPHICS_CACHE_SIZE", "64"))
+    # Seconds between background refreshes of the precomputed analytics
+    ANALYTICS_REFRESH_INTERVAL = int(os.getenv("ANALYTICS_REFRESH_INTERVAL", "60"))
+    # Incremental jobs only fold events older than this, to catch late inserts
+    ANALYTICS_LAG_SECONDS = int(os.getenv("ANALYTICS_LAG_SECONDS", "300"))
+    # How long a worker may hold an incremental job before another can take over
+    ANALYTICS_LEASE_SECONDS = int(os.getenv("ANALYTICS_LEASE_SECONDS", "600"))
+    
+    # Photo proxy configuration
+    PHOTO_SOURCE = os.getenv("PHOTO_SOURCE", "local")  # "local" or "telegram"
+    PHOTO_SOURCE_DIR = os.getenv("PHOTO_SOURCE_DIR", "photos")
+    PHOTO_CACHE_DIR = os.getenv("PHOTO_CACHE_DIR", "photo_cache")
+    PHOTO_CACHE_MAX_BYTES = int(os.getenv("PHOTO_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+    TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 
 settings = Settings()
\ No newline at end of file
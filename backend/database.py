@@ -1,7 +1,9 @@
 import logging
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import PyMongoError
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne, UpdateMany, ReturnDocument
+from pymongo.errors import PyMongoError, DuplicateKeyError, BulkWriteError
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from functools import partial
 from bson import ObjectId
 from datetime import datetime, timedelta
 import os
@@ -9,10 +11,102 @@ from config import settings
 
 logger = logging.getLogger(__name__)
 
+NOT_SPECIFIED = "Not specified"
+
+# Bucketed demographic dimensions: $bucket boundaries (with an explicit upper
+# bound) and one label per bucket. Missing, null and out-of-range values fall
+# into the $bucket default and are reported as NOT_SPECIFIED.
+DEMOGRAPHIC_BUCKETS = {
+    "age": (
+        [0, 18, 25, 35, 45, 55, 65, 150],
+        ["Under 18", "18-24", "25-34", "35-44", "45-54", "55-64", "65+"]
+    ),
+    "coins": (
+        [0, 1, 50, 100, 500, 1000, 10 ** 12],
+        ["0", "1-49", "50-99", "100-499", "500-999", "1000+"]
+    ),
+}
+_BUCKET_DEFAULT = "unspecified"
+
+def _bucket_stage(field: str) -> List[Dict]:
+    boundaries, _ = DEMOGRAPHIC_BUCKETS[field]
+    return [{"$bucket": {
+        # Missing/null map below the first boundary, into the default bucket
+        "groupBy": {"$ifNull": [f"${field}", -1]},
+        "boundaries": boundaries,
+        "default": _BUCKET_DEFAULT,
+        "output": {"count": {"$sum": 1}}
+    }}]
+
+def _group_stage(field: str) -> List[Dict]:
+    return [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+
+# Sub-pipelines for the single-pass $facet demographics aggregation
+DEMOGRAPHIC_FACETS = {
+    "gender": _group_stage("gender"),
+    "age": _bucket_stage("age"),
+    "religion": _group_stage("religion"),
+    "city": _group_stage("city"),
+    "language": _group_stage("language"),
+    "coins": _bucket_stage("coins"),
+}
+
+# Source collections for the activity charts: (collection, breakdown field)
+ACTIVITY_METRICS = {
+    "messages": ("messages", "$message_type"),
+    "likes": ("likes", None),
+    "blocks": ("blocks", None),
+}
+ACTIVITY_GRANULARITIES = ("hour", "day")
+
+# Weeks after signup tracked by the cohort retention matrix
+RETENTION_WEEKS = 12
+# Events that count as retained activity: (collection, acting user field)
+RETENTION_EVENTS = (("messages", "$from_user_id"), ("likes", "$user_id"))
+# Users handled per lookup while folding retention, to keep $in lists small
+RETENTION_BATCH_SIZE = 1000
+
+# Abuse-risk scoring. Each report adds weight * 2^((t - epoch) / half_life), so
+# the stored score is the decayed score scaled by a factor that is the same for
+# every user at any moment: sorting by the stored value ranks by current risk.
+RISK_EPOCH = datetime(2024, 1, 1)
+RISK_HALF_LIFE_DAYS = 14
+# Risk signals: (collection, reported user field, counter name, weight)
+RISK_SIGNALS = (
+    ("complaints", "$reported_user_id", "complaints", 3.0),
+    ("blocks", "$blocked_user_id", "blocks", 1.0),
+)
+
+def current_risk(stored_score: float, now: Optional[datetime] = None) -> float:
+    """Convert a stored risk score into the decayed score as of now"""
+    elapsed_days = ((now or datetime.utcnow()) - RISK_EPOCH).total_seconds() / 86400
+    return round(stored_score / 2 ** (elapsed_days / RISK_HALF_LIFE_DAYS), 3)
+
+def _window_query(lower: Optional[datetime], upper: datetime) -> Dict[str, Any]:
+    """Match documents created in the (lower, upper] window of an incremental job"""
+    created_at: Dict[str, Any] = {"$lte": upper}
+    if lower:
+        created_at["$gt"] = lower
+    return {"created_at": created_at}
+
+def _day_start(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def conversation_key(user_a: int, user_b: int) -> str:
+    """Order-independent key shared by both directions of a conversation"""
+    low, high = sorted((user_a, user_b))
+    return f"{low}:{high}"
+
+def _week_start(value: datetime) -> datetime:
+    """Monday 00:00 of the week containing value"""
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday())
+
 class Database:
     def __init__(self):
         self.client = MongoClient(settings.MONGODB_URI)
         self.db = self.client[settings.DATABASE_NAME]
+        self._demographics_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
         self.create_indexes()
     
     def create_indexes(self):
@@ -34,24 +128,81 @@ class Database:
             self.db.messages.create_index([("from_user_id", ASCENDING), ("to_user_id", ASCENDING)])
             self.db.messages.create_index([("to_user_id", ASCENDING)])
             self.db.messages.create_index([("created_at", DESCENDING)])
+            self.db.messages.create_index([("conversation_key", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
             
             # Blocks collection indexes
             self.db.blocks.create_index([("user_id", ASCENDING), ("blocked_user_id", ASCENDING)], unique=True)
+            self.db.blocks.create_index([("created_at", DESCENDING)])
             
             # Complaints collection indexes
             self.db.complaints.create_index([("user_id", ASCENDING)])
             self.db.complaints.create_index([("status", ASCENDING)])
             self.db.complaints.create_index([("created_at", DESCENDING)])
+            self.db.complaints.create_index([("reported_user_id", ASCENDING)])
+            self.db.complaints.create_index(
+                [("status", ASCENDING), ("risk_score", DESCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]
+            )
             
             # Payments collection indexes
             self.db.payments.create_index([("user_id", ASCENDING)])
             self.db.payments.create_index([("status", ASCENDING)])
             self.db.payments.create_index([("created_at", DESCENDING)])
+            self.db.payments.create_index([("revenue_synced", ASCENDING)])
+            
+            # Precomputed analytics collections
+            self.db.activity_buckets.create_index(
+                [("metric", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING), ("type", ASCENDING)],
+                unique=True
+            )
+            
+            self.db.user_cohorts.create_index([("cohort", ASCENDING)])
+            self.db.user_cohorts.create_index([("size_counted", ASCENDING)])
+            self.db.revenue_daily.create_index(
+                [("day", ASCENDING), ("package_name", ASCENDING), ("status", ASCENDING)],
+                unique=True
+            )
+            self.db.revenue_turnaround.create_index([("day", ASCENDING), ("status", ASCENDING)], unique=True)
             
             logger.info("✅ Created MongoDB indexes")
         except Exception as e:
             logger.error(f"❌ Error creating indexes: {e}")
     
+    def backfill_conversation_keys(self, batch_size: int = 1000) -> int:
+        """Set conversation_key on messages written without one.
+        
+        Runs from the background job: the first pass migrates existing
+        messages, later passes only touch messages inserted without a key.
+        Messages missing either user id get a null key so later batches move
+        past them.
+        """
+        updated = 0
+        malformed = 0
+        try:
+            while True:
+                batch = list(self.db.messages.find(
+                    {"conversation_key": {"$exists": False}},
+                    {"from_user_id": 1, "to_user_id": 1}
+                ).limit(batch_size))
+                if not batch:
+                    break
+                operations = []
+                for message in batch:
+                    if message.get("from_user_id") is None or message.get("to_user_id") is None:
+                        key = None
+                        malformed += 1
+                    else:
+                        key = conversation_key(message["from_user_id"], message["to_user_id"])
+                    operations.append(UpdateOne({"_id": message["_id"]}, {"$set": {"conversation_key": key}}))
+                self.db.messages.bulk_write(operations, ordered=False)
+                updated += len(batch)
+            if updated:
+                logger.info(f"✅ Backfilled conversation keys on {updated} messages")
+            if malformed:
+                logger.warning(f"Skipped {malformed} messages without both user ids while backfilling conversation keys")
+        except Exception as e:
+            logger.error(f"❌ Error backfilling conversation keys: {e}")
+        return updated
+    
     # User Methods
     def get_users(self, skip: int = 0, limit: int = 100, filters: Optional[Dict] = None) -> List[Dict]:
         """Get users with pagination and filtering"""
@@ -87,6 +238,8 @@ class Database:
                 {"user_id": user_id},
                 {"$set": update_data}
             )
+            if result.modified_count > 0:
+                self._demographics_cache.clear()
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Error updating user: {e}")
@@ -106,6 +259,7 @@ class Database:
                     self.db.blocks.delete_many({"$or": [{"user_id": user_id}, {"blocked_user_id": user_id}]})
                     self.db.complaints.delete_many({"user_id": user_id})
                     self.db.payments.delete_many({"user_id": user_id})
+            self._demographics_cache.clear()
             return True
         except Exception as e:
             logger.error(f"Error deleting user: {e}")
@@ -146,22 +300,180 @@ class Database:
             return None
     
     def update_payment_status(self, payment_id: str, status: str, admin_id: int, notes: str = None) -> bool:
-        """Update payment status"""
+        """Update payment status and the revenue aggregates it feeds"""
         try:
-            result = self.db.payments.update_one(
+            payment = self.db.payments.find_one_and_update(
                 {"_id": ObjectId(payment_id)},
                 {"$set": {
                     "status": status,
                     "processed_at": datetime.utcnow(),
                     "processed_by": admin_id,
-                    "admin_notes": notes
-                }}
+                    "admin_notes": notes,
+                    "revenue_synced": False
+                }},
+                return_document=ReturnDocument.AFTER
             )
-            return result.modified_count > 0
+            if payment is None:
+                return False
+            try:
+                self._sync_revenue(payment["_id"])
+            except Exception as e:
+                # Left unsynced, so refresh_revenue finishes the job
+                logger.error(f"Error updating revenue aggregates: {e}")
+            return True
         except Exception as e:
             logger.error(f"Error updating payment status: {e}")
             return False
     
+    def _move_revenue(self, payment: Dict, status: str, sign: int) -> None:
+        """Add (sign=1) or remove (sign=-1) a payment from the daily aggregates for status"""
+        self.db.revenue_daily.update_one(
+            {
+                "day": _day_start(payment["created_at"]),
+                "package_name": payment.get("package_name"),
+                "status": status
+            },
+            {"$inc": {
+                "count": sign,
+                "revenue": sign * payment.get("price", 0),
+                "coins": sign * payment.get("coins_amount", 0)
+            }},
+            upsert=True
+        )
+    
+    def _record_turnaround(self, payment: Dict) -> None:
+        """Add a processed payment's approval turnaround to the aggregates"""
+        seconds = (payment["processed_at"] - payment["created_at"]).total_seconds()
+        self.db.revenue_turnaround.update_one(
+            {"day": _day_start(payment["processed_at"]), "status": payment["status"]},
+            {"$inc": {"count": 1, "total_seconds": seconds}, "$max": {"max_seconds": seconds}},
+            upsert=True
+        )
+    
+    def _claim_and_apply(self, payment_id: ObjectId, field: str, current: Any, claimed: Any, apply: Callable[[], None]) -> None:
+        """Move a payment's field from current to claimed, then run apply.
+        
+        The compare-and-swap makes sure only one worker applies the change; if
+        apply fails the field is moved back and the payment marked unsynced,
+        so the change is retried rather than lost. None means the field is absent.
+        """
+        def matches(value):
+            return {field: value} if value is not None else {field: {"$exists": False}}
+        
+        def assign(value):
+            return {"$set": {field: value}} if value is not None else {"$unset": {field: ""}}
+        
+        claim = self.db.payments.update_one({"_id": payment_id, **matches(current)}, assign(claimed))
+        if claim.modified_count == 0:
+            return
+        try:
+            apply()
+        except Exception:
+            release = assign(current)
+            release.setdefault("$set", {})["revenue_synced"] = False
+            self.db.payments.update_one({"_id": payment_id, **matches(claimed)}, release)
+            raise
+    
+    def _sync_revenue(self, payment_id: ObjectId) -> None:
+        """Bring the revenue aggregates in line with a payment's current state.
+        
+        revenue_status records the status the payment is counted under and
+        turnaround_counted whether its turnaround was recorded; both only change
+        through _claim_and_apply, so every change is applied exactly once.
+        """
+        while True:
+            payment = self.db.payments.find_one({"_id": payment_id})
+            if payment is None:
+                return
+            status = payment.get("status")
+            counted = payment.get("revenue_status")
+            if status is not None and counted != status:
+                if counted is not None:
+                    self._claim_and_apply(payment_id, "revenue_status", counted, None,
+                                          partial(self._move_revenue, payment, counted, -1))
+                else:
+                    self._claim_and_apply(payment_id, "revenue_status", None, status,
+                                          partial(self._move_revenue, payment, status, 1))
+                continue
+            if status not in (None, "pending") and payment.get("processed_at") and not payment.get("turnaround_counted"):
+                self._claim_and_apply(payment_id, "turnaround_counted", None, True,
+                                      partial(self._record_turnaround, payment))
+                continue
+            # A status change made meanwhile resets the flag, so this only sticks when nothing is left
+            self.db.payments.update_one(
+                {"_id": payment_id, "status": status, "revenue_synced": {"$ne": True}},
+                {"$set": {"revenue_synced": True}}
+            )
+            return
+    
+    def refresh_revenue(self, batch_size: int = 500) -> None:
+        """Sync the revenue aggregates with payments not counted yet.
+        
+        Covers payments the bot inserted, payments processed before the
+        aggregates existed and updates whose sync failed in update_payment_status.
+        """
+        try:
+            for item in self.db.payments.find({"revenue_synced": {"$ne": True}}, {"_id": 1}).batch_size(batch_size):
+                self._sync_revenue(item["_id"])
+        except Exception as e:
+            logger.error(f"Error refreshing revenue aggregates: {e}")
+    
+    def get_revenue_data(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """Get revenue, approval turnaround and coin liability from the aggregates"""
+        try:
+            days = []
+            current = _day_start(start_date)
+            while current <= end_date:
+                days.append(current)
+                current += timedelta(days=1)
+            day_range = {"$gte": days[0], "$lte": end_date} if days else {"$lte": end_date}
+            
+            revenue: Dict[str, Dict[datetime, float]] = {}
+            by_status: Dict[str, Dict[str, Any]] = {}
+            for item in self.db.revenue_daily.find({"day": day_range}):
+                totals = by_status.setdefault(item["status"], {"count": 0, "revenue": 0.0, "coins": 0})
+                totals["count"] += item["count"]
+                totals["revenue"] += item["revenue"]
+                totals["coins"] += item["coins"]
+                if item["status"] == "approved":
+                    package = item["package_name"] or "Unknown"
+                    daily = revenue.setdefault(package, {})
+                    daily[item["day"]] = daily.get(item["day"], 0.0) + item["revenue"]
+            
+            turnaround = {"count": 0, "avg_hours": 0.0, "max_hours": 0.0}
+            total_seconds = 0.0
+            for item in self.db.revenue_turnaround.find({"day": day_range}):
+                turnaround["count"] += item["count"]
+                total_seconds += item["total_seconds"]
+                turnaround["max_hours"] = max(turnaround["max_hours"], round(item["max_seconds"] / 3600, 2))
+            if turnaround["count"]:
+                turnaround["avg_hours"] = round(total_seconds / turnaround["count"] / 3600, 2)
+            
+            # revenue_daily is a few documents per day, so all-time totals are cheap to sum
+            coins = {item["_id"]: item["coins"] for item in self.db.revenue_daily.aggregate([
+                {"$match": {"status": {"$in": ["pending", "approved"]}}},
+                {"$group": {"_id": "$status", "coins": {"$sum": "$coins"}}}
+            ])}
+            return {
+                "labels": [day.strftime("%b %d") for day in days],
+                "revenue": {
+                    package: [round(daily.get(day, 0.0), 2) for day in days]
+                    for package, daily in sorted(revenue.items())
+                },
+                "totals_by_status": {
+                    status: {**totals, "revenue": round(totals["revenue"], 2)}
+                    for status, totals in by_status.items()
+                },
+                "turnaround": turnaround,
+                "coin_liability": {
+                    "pending_coins": coins.get("pending", 0),
+                    "issued_coins": coins.get("approved", 0)
+                }
+            }
+        except Exception as e:
+            logger.error(f"Error getting revenue data: {e}")
+            return {"labels": [], "revenue": {}, "totals_by_status": {}, "turnaround": {}, "coin_liability": {}}
+    
     def get_payments_count(self, filters: Optional[Dict] = None) -> int:
         """Get payments count"""
         try:
@@ -176,7 +488,8 @@ class Database:
         """Get complaints with pagination and filtering"""
         try:
             query = filters or {}
-            cursor = self.db.complaints.find(query).skip(skip).limit(limit).sort("created_at", DESCENDING)
+            # risk_score is an internal, unscaled sort key maintained for triage
+            cursor = self.db.complaints.find(query, {"risk_score": 0}).skip(skip).limit(limit).sort("created_at", DESCENDING)
             return list(cursor)
         except Exception as e:
             logger.error(f"Error getting complaints: {e}")
@@ -194,6 +507,134 @@ class Database:
             logger.error(f"Error updating complaint status: {e}")
             return False
     
+    def refresh_risk_scores(self) -> None:
+        """Fold new complaints and blocks into per-user risk scores.
+        
+        Scores live in user_risk and are copied onto the reported user's
+        complaints as risk_score so the triage queue can be read off an index.
+        """
+        for signal in RISK_SIGNALS:
+            self._run_window(f"risk:{signal[0]}", partial(self._fold_risk, signal))
+        try:
+            self._provision_risk_scores()
+        except Exception as e:
+            logger.error(f"Error provisioning risk scores: {e}")
+    
+    def _fold_risk(self, signal: Tuple[str, str, str, float], lower: Optional[datetime], upper: datetime) -> None:
+        collection, user_field, counter, weight = signal
+        half_life_ms = RISK_HALF_LIFE_DAYS * 24 * 60 * 60 * 1000
+        pipeline = [
+            {"$match": {**_window_query(lower, upper), user_field[1:]: {"$ne": None}}},
+            {"$group": {
+                "_id": user_field,
+                "count": {"$sum": 1},
+                "score": {"$sum": {"$multiply": [weight, {"$pow": [2, {"$divide": [
+                    {"$subtract": ["$created_at", RISK_EPOCH]}, half_life_ms
+                ]}]}]}},
+                "last_event_at": {"$max": "$created_at"}
+            }}
+        ]
+        operations = []
+        touched = []
+        for item in getattr(self.db, collection).aggregate(pipeline):
+            operations.append(UpdateOne(
+                {"_id": item["_id"], f"{counter}_through": {"$not": {"$gte": upper}}},
+                {
+                    "$inc": {"score": item["score"], counter: item["count"]},
+                    "$max": {f"last_{counter[:-1]}_at": item["last_event_at"]},
+                    "$set": {f"{counter}_through": upper}
+                },
+                upsert=True
+            ))
+            touched.append(item["_id"])
+        self._apply_once(self.db.user_risk, operations)
+        # Copying is idempotent, so a retried window copies again without adding again
+        self._copy_risk_scores(touched)
+    
+    def _copy_risk_scores(self, user_ids: List[int]) -> None:
+        """Copy the current user_risk scores onto the users' complaints"""
+        if not user_ids:
+            return
+        operations = [
+            UpdateMany({"reported_user_id": risk["_id"]}, {"$set": {"risk_score": risk["score"]}})
+            for risk in self.db.user_risk.find({"_id": {"$in": user_ids}}, {"score": 1})
+        ]
+        if operations:
+            self.db.complaints.bulk_write(operations, ordered=False)
+    
+    def _provision_risk_scores(self) -> None:
+        """Give pending complaints not scored yet a provisional triage key.
+        
+        Runs on every refresh, without the analytics lag: a new complaint enters
+        the queue with its reported user's current score (0 for a first report)
+        and gets its real score once its window is folded.
+        """
+        reported = self.db.complaints.distinct("reported_user_id", {"status": "pending", "risk_score": None})
+        if not reported:
+            return
+        known = [user_id for user_id in reported if user_id is not None]
+        scores = {risk["_id"]: risk["score"] for risk in self.db.user_risk.find({"_id": {"$in": known}}, {"score": 1})}
+        self.db.complaints.bulk_write([
+            UpdateMany(
+                {"status": "pending", "risk_score": None, "reported_user_id": user_id},
+                {"$set": {"risk_score": scores.get(user_id, 0.0)}}
+            )
+            for user_id in reported
+        ], ordered=False)
+    
+    def get_unscored_complaints_count(self) -> int:
+        """Get the number of pending complaints still waiting for a triage key"""
+        try:
+            return self.db.complaints.count_documents({"status": "pending", "risk_score": None})
+        except Exception as e:
+            logger.error(f"Error getting unscored complaints count: {e}")
+            return 0
+    
+    def get_complaint_triage(
+        self,
+        limit: int = 100,
+        after: Optional[Tuple[float, datetime, ObjectId]] = None
+    ) -> Tuple[List[Dict], Optional[Tuple[float, datetime, ObjectId]]]:
+        """Get one page of pending complaints ordered by the reported user's risk score.
+        
+        Pages are keyed on (risk_score, created_at, _id) so each page is a range
+        scan on the triage index. Complaints enter the queue once the background
+        job has given them a provisional or real score; get_unscored_complaints_count
+        reports those still waiting. Returns the page and the key to pass as
+        `after` for the next one (None on the last page).
+        """
+        try:
+            query: Dict[str, Any] = {"status": "pending", "risk_score": {"$ne": None}}
+            if after:
+                score, created_at, complaint_id = after
+                query["$or"] = [
+                    {"risk_score": {"$lt": score}},
+                    {"risk_score": score, "created_at": {"$lt": created_at}},
+                    {"risk_score": score, "created_at": created_at, "_id": {"$lt": complaint_id}}
+                ]
+            cursor = self.db.complaints.find(query).sort([
+                ("risk_score", DESCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)
+            ]).limit(limit)
+            complaints = list(cursor)
+            
+            next_key = None
+            if len(complaints) == limit:
+                last = complaints[-1]
+                next_key = (last["risk_score"], last["created_at"], last["_id"])
+            
+            reported_ids = [c["reported_user_id"] for c in complaints if c.get("reported_user_id") is not None]
+            risks = {risk["_id"]: risk for risk in self.db.user_risk.find({"_id": {"$in": reported_ids}})}
+            now = datetime.utcnow()
+            for complaint in complaints:
+                risk = risks.get(complaint.get("reported_user_id"), {})
+                complaint["risk_score"] = current_risk(risk.get("score", 0.0), now)
+                complaint["reported_complaints"] = risk.get("complaints", 0)
+                complaint["reported_blocks"] = risk.get("blocks", 0)
+            return complaints, next_key
+        except Exception as e:
+            logger.error(f"Error getting complaint triage: {e}")
+            return [], None
+    
     # Stats Methods
     def get_stats(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> Dict[str, Any]:
         """Get dashboard statistics for given date range"""
@@ -350,5 +791,501 @@ class Database:
             logger.error(f"Error getting registration data: {e}")
             return {"labels": [], "data": []}
 
+    def get_demographics(
+        self,
+        dimensions: List[str],
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        is_active: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """Get demographic distributions for several dimensions in one $facet pass.
+        
+        Counts for users created more than ANALYTICS_LAG_SECONDS ago are cached
+        per (dimensions, filters) and extended on each call with the users that
+        have settled since; newer users are counted fresh every time, so a late
+        insert with an older created_at is still picked up. Changes the bot
+        makes to existing users (coins, city, is_active, ...) show up once the
+        entry expires after DEMOGRAPHICS_CACHE_TTL; updates and deletes made
+        through this API drop the cache straight away.
+        """
+        try:
+            dimensions = list(dict.fromkeys(dimensions))
+            key = (tuple(sorted(dimensions)), start_date, end_date, is_active)
+            now = datetime.utcnow()
+            settled = now - timedelta(seconds=settings.ANALYTICS_LAG_SECONDS)
+            entry = self._demographics_cache.pop(key, None)
+            if entry and (now - entry["computed_at"]).total_seconds() > settings.DEMOGRAPHICS_CACHE_TTL:
+                entry = None
+            if entry is None:
+                entry = {
+                    "counts": {dimension: {} for dimension in dimensions},
+                    "total": 0,
+                    "high_water": None,
+                    "computed_at": now
+                }
+            
+            base: Dict[str, Any] = {}
+            if is_active is not None:
+                base["is_active"] = is_active
+            created_at: Dict[str, Any] = {}
+            if start_date:
+                created_at["$gte"] = start_date
+            if end_date:
+                created_at["$lte"] = end_date
+            
+            # Fold users that settled since the last call into the cached counts;
+            # $not keeps users without a created_at in the first pass
+            settled_range = {**created_at, "$not": {"$gt": settled}}
+            if entry["high_water"]:
+                settled_range["$gt"] = entry["high_water"]
+            total, counts = self._count_demographics(dimensions, {**base, "created_at": settled_range})
+            entry["total"] += total
+            for dimension in dimensions:
+                for label, count in counts[dimension].items():
+                    entry["counts"][dimension][label] = entry["counts"][dimension].get(label, 0) + count
+            entry["high_water"] = settled
+            # Keep the most recently used entries only; every distinct filter combination is a key
+            self._demographics_cache[key] = entry
+            while len(self._demographics_cache) > settings.DEMOGRAPHICS_CACHE_SIZE:
+                self._demographics_cache.popitem(last=False)
+            
+            # Users still inside the lag are never cached
+            total = entry["total"]
+            counts = {dimension: dict(entry["counts"][dimension]) for dimension in dimensions}
+            if not end_date or end_date > settled:
+                recent_total, recent = self._count_demographics(
+                    dimensions, {**base, "created_at": {**created_at, "$gt": settled}}
+                )
+                total += recent_total
+                for dimension in dimensions:
+                    for label, count in recent[dimension].items():
+                        counts[dimension][label] = counts[dimension].get(label, 0) + count
+            
+            return {
+                "dimensions": {
+                    dimension: self._demographic_chart(dimension, counts[dimension])
+                    for dimension in dimensions
+                },
+                "total_users": total
+            }
+        except Exception as e:
+            logger.error(f"Error getting demographics: {e}")
+            return {"dimensions": {}, "total_users": 0}
+    
+    def _count_demographics(self, dimensions: List[str], query: Dict[str, Any]) -> Tuple[int, Dict[str, Dict[str, int]]]:
+        """Count matching users per label for each dimension in a single $facet pass"""
+        facets = {dimension: DEMOGRAPHIC_FACETS[dimension] for dimension in dimensions}
+        facets["_summary"] = [{"$group": {"_id": None, "total": {"$sum": 1}}}]
+        result = next(self.db.users.aggregate([{"$match": query}, {"$facet": facets}]), {})
+        
+        counts: Dict[str, Dict[str, int]] = {dimension: {} for dimension in dimensions}
+        summary = result.get("_summary") or []
+        if not summary:
+            return 0, counts
+        for dimension in dimensions:
+            for item in result.get(dimension, []):
+                label = self._demographic_label(dimension, item["_id"])
+                counts[dimension][label] = counts[dimension].get(label, 0) + item["count"]
+        return summary[0]["total"], counts
+    
+    def _demographic_label(self, dimension: str, value: Any) -> str:
+        """Turn a $group/$bucket key into a chart label"""
+        if dimension in DEMOGRAPHIC_BUCKETS:
+            if value == _BUCKET_DEFAULT:
+                return NOT_SPECIFIED
+            boundaries, labels = DEMOGRAPHIC_BUCKETS[dimension]
+            return labels[boundaries.index(value)]
+        if value is None or value == "":
+            return NOT_SPECIFIED
+        return str(value).capitalize()
+    
+    def _demographic_chart(self, dimension: str, counts: Dict[str, int]) -> Dict[str, List]:
+        """Order dimension counts for charting"""
+        if dimension in DEMOGRAPHIC_BUCKETS:
+            order = DEMOGRAPHIC_BUCKETS[dimension][1] + [NOT_SPECIFIED]
+            labels = [label for label in order if label in counts]
+        else:
+            labels = sorted(counts, key=lambda label: counts[label], reverse=True)
+        return {"labels": labels, "data": [counts[label] for label in labels]}
+
+    # Message Methods
+    def get_conversation(
+        self,
+        user_a: int,
+        user_b: int,
+        limit: int = 50,
+        before: Optional[Tuple[datetime, ObjectId]] = None
+    ) -> List[Dict]:
+        """Get one page of the messages between two users, newest first.
+        
+        Pages are keyed on (created_at, _id) rather than skipped, so every page
+        is a bounded range scan on the conversation_key index. This is a pure
+        read: messages inserted without a conversation_key appear once the
+        background job has keyed them, so writers should set it at insert time
+        with conversation_key().
+        """
+        try:
+            query: Dict[str, Any] = {"conversation_key": conversation_key(user_a, user_b)}
+            if before:
+                created_at, message_id = before
+                query["$or"] = [
+                    {"created_at": {"$lt": created_at}},
+                    {"created_at": created_at, "_id": {"$lt": message_id}}
+                ]
+            cursor = self.db.messages.find(query).sort(
+                [("created_at", DESCENDING), ("_id", DESCENDING)]
+            ).limit(limit)
+            return list(cursor)
+        except Exception as e:
+            logger.error(f"Error getting conversation: {e}")
+            return []
+    
+    # Incremental Analytics Methods
+    def refresh_analytics(self) -> None:
+        """Bring every precomputed analytics collection up to date"""
+        self.refresh_activity_buckets()
+        self.refresh_retention()
+        self.refresh_risk_scores()
+        self.refresh_revenue()
+    
+    def _run_window(self, name: str, job: Callable[[Optional[datetime], datetime], None]) -> bool:
+        """Run an incremental job over the events created in (high_water, now - lag].
+        
+        The job's analytics_state document is leased to one worker at a time,
+        and only the worker whose lease token is still current can record the
+        window as done. The window's upper bound is pinned in the state until
+        it completes, so a failed or abandoned run is retried over exactly the
+        same bounds; jobs guard their writes per window (see _apply_once), so a
+        retry never counts an event twice. The lag leaves room for writers
+        whose created_at is set some time before the insert lands.
+        """
+        now = datetime.utcnow()
+        token = ObjectId()
+        try:
+            state = self.db.analytics_state.find_one_and_update(
+                {"_id": name, "$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}]},
+                {"$set": {
+                    "locked_until": now + timedelta(seconds=settings.ANALYTICS_LEASE_SECONDS),
+                    "lease": token
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker holds the lease
+            return False
+        
+        lower = state.get("high_water")
+        upper = state.get("window_upper")
+        if upper is None:
+            upper = now - timedelta(seconds=settings.ANALYTICS_LAG_SECONDS)
+            if lower and lower >= upper:
+                self._release_window(name, token)
+                return False
+            pinned = self.db.analytics_state.update_one({"_id": name, "lease": token}, {"$set": {"window_upper": upper}})
+            if pinned.modified_count == 0:
+                return False
+        try:
+            job(lower, upper)
+        except Exception as e:
+            logger.error(f"Error running incremental job {name}: {e}")
+            self._release_window(name, token)
+            return False
+        result = self.db.analytics_state.update_one(
+            {"_id": name, "lease": token},
+            {
+                "$set": {"high_water": upper, "locked_until": None, "updated_at": now},
+                "$unset": {"window_upper": "", "lease": ""}
+            }
+        )
+        if result.modified_count == 0:
+            logger.warning(f"Lease on incremental job {name} expired before it finished; window left to its new owner")
+            return False
+        return True
+    
+    def _release_window(self, name: str, token: ObjectId) -> None:
+        """Give up a lease without moving the high-water mark"""
+        self.db.analytics_state.update_one(
+            {"_id": name, "lease": token},
+            {"$set": {"locked_until": None}, "$unset": {"lease": ""}}
+        )
+    
+    def _apply_once(self, collection, operations: List[UpdateOne]) -> None:
+        """Bulk-apply an incremental job's guarded upserts.
+        
+        Each $inc is filtered on the document's last applied window being older
+        than the current one. When a retried window reaches a document it has
+        already updated, the filter misses and the upsert collides with the
+        existing document on its unique key; those duplicate-key errors mean
+        "already applied" and are ignored.
+        """
+        if not operations:
+            return
+        try:
+            collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if errors or e.details.get("writeConcernErrors"):
+                raise
+    
+    def refresh_activity_buckets(self) -> None:
+        """Fold new messages, likes and blocks into hourly/daily activity buckets"""
+        for metric in ACTIVITY_METRICS:
+            self._run_window(f"activity:{metric}", partial(self._fold_activity, metric))
+    
+    def _fold_activity(self, metric: str, lower: Optional[datetime], upper: datetime) -> None:
+        collection, type_field = ACTIVITY_METRICS[metric]
+        operations = []
+        for granularity in ACTIVITY_GRANULARITIES:
+            date_parts = {
+                "year": {"$year": "$created_at"},
+                "month": {"$month": "$created_at"},
+                "day": {"$dayOfMonth": "$created_at"},
+            }
+            if granularity == "hour":
+                date_parts["hour"] = {"$hour": "$created_at"}
+            pipeline = [
+                {"$match": _window_query(lower, upper)},
+                {"$group": {
+                    "_id": {
+                        "bucket": {"$dateFromParts": date_parts},
+                        "type": {"$ifNull": [type_field, "all"]} if type_field else "all"
+                    },
+                    "count": {"$sum": 1}
+                }}
+            ]
+            for item in getattr(self.db, collection).aggregate(pipeline):
+                operations.append(UpdateOne(
+                    {
+                        "metric": metric,
+                        "granularity": granularity,
+                        "bucket": item["_id"]["bucket"],
+                        "type": item["_id"]["type"],
+                        "applied_through": {"$not": {"$gte": upper}}
+                    },
+                    {"$inc": {"count": item["count"]}, "$set": {"applied_through": upper}},
+                    upsert=True
+                ))
+        self._apply_once(self.db.activity_buckets, operations)
+    
+    def get_activity_data(
+        self,
+        metric: str,
+        granularity: str,
+        start_date: datetime,
+        end_date: datetime
+    ) -> Dict[str, Any]:
+        """Get bucketed activity counts from the precomputed collection.
+        
+        Buckets are kept up to date by refresh_analytics in the background, so
+        this only reads activity_buckets.
+        """
+        try:
+            if granularity == "hour":
+                step = timedelta(hours=1)
+                current = start_date.replace(minute=0, second=0, microsecond=0)
+                label_format = "%b %d %H:00"
+            else:
+                step = timedelta(days=1)
+                current = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+                label_format = "%b %d"
+            
+            buckets = []
+            while current <= end_date:
+                buckets.append(current)
+                current += step
+            
+            cursor = self.db.activity_buckets.find({
+                "metric": metric,
+                "granularity": granularity,
+                "bucket": {"$gte": buckets[0], "$lte": end_date}
+            }) if buckets else []
+            
+            counts: Dict[str, Dict[datetime, int]] = {}
+            for item in cursor:
+                counts.setdefault(item["type"], {})[item["bucket"]] = item["count"]
+            
+            return {
+                "labels": [bucket.strftime(label_format) for bucket in buckets],
+                "datasets": {
+                    bucket_type: [type_counts.get(bucket, 0) for bucket in buckets]
+                    for bucket_type, type_counts in sorted(counts.items())
+                }
+            }
+        except Exception as e:
+            logger.error(f"Error getting activity data: {e}")
+            return {"labels": [], "datasets": {}}
+
+    def refresh_retention(self) -> None:
+        """Assign new users to weekly cohorts and fold new activity into cohort counters.
+        
+        Each user gets a user_cohorts document holding their cohort week and an
+        active_weeks bitset (bit k = active in week W+k). cohort_retention keeps,
+        per cohort, its size and the number of users active in each later week.
+        """
+        try:
+            # Recover sizes whose update failed on an earlier pass
+            self._count_cohort_sizes()
+        except Exception as e:
+            logger.error(f"Error counting cohort sizes: {e}")
+        self._run_window("retention:users", self._fold_cohorts)
+        for event in RETENTION_EVENTS:
+            self._run_window(f"retention:{event[0]}", partial(self._fold_retention, event))
+    
+    def _fold_cohorts(self, lower: Optional[datetime], upper: datetime) -> None:
+        users = self.db.users.find(_window_query(lower, upper), {"user_id": 1, "created_at": 1})
+        batch = []
+        for user in users:
+            batch.append(user)
+            if len(batch) >= RETENTION_BATCH_SIZE:
+                self._assign_cohorts(batch)
+                batch = []
+        if batch:
+            self._assign_cohorts(batch)
+    
+    def _assign_cohorts(self, users: List[Dict]) -> None:
+        """Give users without a cohort one and add them to their cohort's size"""
+        users = [user for user in users if user.get("created_at")]
+        if not users:
+            return
+        self.db.user_cohorts.bulk_write([
+            UpdateOne(
+                {"_id": user["user_id"]},
+                {"$setOnInsert": {
+                    "cohort": _week_start(user["created_at"]),
+                    "active_weeks": 0,
+                    "size_counted": False
+                }},
+                upsert=True
+            )
+            for user in users
+        ], ordered=False)
+        self._count_cohort_sizes()
+    
+    def _count_cohort_sizes(self) -> None:
+        """Add cohort documents not yet counted to their cohort's size.
+        
+        Each document is claimed by flipping size_counted before the size is
+        incremented; claims whose increment fails are handed back, so the next
+        pass counts them instead of losing them.
+        """
+        while True:
+            pending = list(self.db.user_cohorts.find({"size_counted": False}, {"cohort": 1}).limit(RETENTION_BATCH_SIZE))
+            if not pending:
+                return
+            claimed: Dict[datetime, List[int]] = {}
+            for doc in pending:
+                result = self.db.user_cohorts.update_one(
+                    {"_id": doc["_id"], "size_counted": False},
+                    {"$set": {"size_counted": True}}
+                )
+                if result.modified_count == 1:
+                    claimed.setdefault(doc["cohort"], []).append(doc["_id"])
+            
+            sizes = list(claimed.items())
+            for index, (cohort, user_ids) in enumerate(sizes):
+                try:
+                    self.db.cohort_retention.update_one({"_id": cohort}, {"$inc": {"size": len(user_ids)}}, upsert=True)
+                except Exception:
+                    unapplied = [user_id for _, ids in sizes[index:] for user_id in ids]
+                    self.db.user_cohorts.update_many({"_id": {"$in": unapplied}}, {"$set": {"size_counted": False}})
+                    raise
+    
+    def _fold_retention(self, event: Tuple[str, str], lower: Optional[datetime], upper: datetime) -> None:
+        collection, user_field = event
+        pipeline = [
+            {"$match": _window_query(lower, upper)},
+            {"$group": {"_id": {
+                "user_id": user_field,
+                "day": {"$dateFromParts": {
+                    "year": {"$year": "$created_at"},
+                    "month": {"$month": "$created_at"},
+                    "day": {"$dayOfMonth": "$created_at"}
+                }}
+            }}}
+        ]
+        active: Dict[int, set] = {}
+        for item in getattr(self.db, collection).aggregate(pipeline):
+            active.setdefault(item["_id"]["user_id"], set()).add(_week_start(item["_id"]["day"]))
+            if len(active) >= RETENTION_BATCH_SIZE:
+                self._mark_active(active)
+                active = {}
+        if active:
+            self._mark_active(active)
+    
+    def _mark_active(self, active: Dict[int, set]) -> None:
+        """Set active-week bits for a batch of users and count each bit the first time it is set"""
+        cohorts = {doc["_id"]: doc for doc in self.db.user_cohorts.find({"_id": {"$in": list(active)}})}
+        missing = [user_id for user_id in active if user_id not in cohorts]
+        if missing:
+            # Users the cohort pass has not seen (e.g. inserted late with an older created_at)
+            self._assign_cohorts(list(self.db.users.find(
+                {"user_id": {"$in": missing}}, {"user_id": 1, "created_at": 1}
+            )))
+            for doc in self.db.user_cohorts.find({"_id": {"$in": missing}}):
+                cohorts[doc["_id"]] = doc
+        
+        for user_id, weeks in active.items():
+            doc = cohorts.get(user_id)
+            while doc is not None:
+                bits = doc.get("active_weeks", 0)
+                offsets = {(week - doc["cohort"]).days // 7 for week in weeks}
+                offsets = [k for k in sorted(offsets) if 1 <= k <= RETENTION_WEEKS and not bits & (1 << k)]
+                if not offsets:
+                    break
+                new_bits = bits
+                for k in offsets:
+                    new_bits |= 1 << k
+                # Compare-and-swap: only the writer that flips the bits counts them
+                result = self.db.user_cohorts.update_one(
+                    {"_id": user_id, "active_weeks": bits},
+                    {"$set": {"active_weeks": new_bits}}
+                )
+                if result.modified_count == 1:
+                    try:
+                        self.db.cohort_retention.update_one(
+                            {"_id": doc["cohort"]},
+                            {"$inc": {f"weeks.{k}": 1 for k in offsets}},
+                            upsert=True
+                        )
+                    except Exception:
+                        # Clear the bits again so the retried window counts them
+                        self.db.user_cohorts.update_one(
+                            {"_id": user_id, "active_weeks": new_bits},
+                            {"$set": {"active_weeks": bits}}
+                        )
+                        raise
+                    break
+                doc = self.db.user_cohorts.find_one({"_id": user_id})
+    
+    def get_retention_matrix(self, cohorts: int = 12) -> List[Dict[str, Any]]:
+        """Get the weekly cohort retention matrix for the most recent cohorts"""
+        try:
+            current_week = _week_start(datetime.utcnow())
+            cursor = self.db.cohort_retention.find().sort("_id", DESCENDING).limit(cohorts)
+            
+            matrix = []
+            for item in reversed(list(cursor)):
+                size = item.get("size", 0)
+                weeks = item.get("weeks", {})
+                elapsed = (current_week - item["_id"]).days // 7
+                retention = []
+                for offset in range(1, RETENTION_WEEKS + 1):
+                    if offset > elapsed:
+                        retention.append(None)
+                    elif size == 0:
+                        retention.append(0.0)
+                    else:
+                        retention.append(round(weeks.get(str(offset), 0) / size * 100, 2))
+                matrix.append({
+                    "cohort": item["_id"].strftime("%Y-%m-%d"),
+                    "size": size,
+                    "retention": retention
+                })
+            return matrix
+        except Exception as e:
+            logger.error(f"Error getting retention matrix: {e}")
+            return []
+
 # Global database instance
 db = Database()
\ No newline at end of file
@@ -1,17 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Query
+from fastapi import FastAPI, HTTPException, Depends, status, Query, Response, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
 from typing import Optional, List
 from datetime import datetime, timedelta
+import asyncio
 import logging
+from bson import ObjectId
 
 from models import (
     User, UserResponse, PaymentResponse, StatsResponse, 
     ChartDataResponse, DateRangeRequest, PaymentUpdateRequest,
-    LoginRequest, Token
+    LoginRequest, Token, DemographicsResponse, ActivityResponse,
+    RetentionResponse, RevenueResponse
+)
+from database import db, DEMOGRAPHIC_FACETS, ACTIVITY_METRICS, ACTIVITY_GRANULARITIES, RETENTION_WEEKS
+from photos import photo_proxy, InvalidPhotoError, THUMBNAIL_SIZES
+from auth import (
+    authenticate_user, create_access_token, get_current_user, get_password_hash,
+    signed_photo_url, verify_photo_signature
 )
-from database import db
-from auth import authenticate_user, create_access_token, get_current_user, get_password_hash
 from config import settings
 
 # Configure logging
@@ -36,6 +44,50 @@ app.add_middleware(
 # Security
 security = HTTPBearer()
 
+async def run_background_jobs():
+    """Key new messages and refresh the precomputed analytics, off the request path"""
+    while True:
+        for job in (db.backfill_conversation_keys, db.refresh_analytics):
+            try:
+                await run_in_threadpool(job)
+            except Exception as e:
+                logger.error(f"Error running background job {job.__name__}: {e}")
+        await asyncio.sleep(settings.ANALYTICS_REFRESH_INTERVAL)
+
+@app.on_event("startup")
+async def start_background_jobs():
+    app.state.background_task = asyncio.create_task(run_background_jobs())
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    app.state.background_task.cancel()
+
+def resolve_date_range(range_type: str):
+    """Translate a dashboard range type into (start_date, end_date)"""
+    end_date = datetime.utcnow()
+    
+    if range_type == "today":
+        start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif range_type == "yesterday":
+        start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        end_date = start_date + timedelta(days=1)
+    elif range_type == "last7":
+        start_date = end_date - timedelta(days=7)
+    elif range_type == "last30":
+        start_date = end_date - timedelta(days=30)
+    elif range_type == "last90":
+        start_date = end_date - timedelta(days=90)
+    elif range_type == "thisMonth":
+        start_date = end_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    elif range_type == "lastMonth":
+        start_date = (end_date.replace(day=1) - timedelta(days=1)).replace(day=1)
+        end_date = start_date.replace(day=28) + timedelta(days=4)  # Last day of month
+    elif range_type == "thisYear":
+        start_date = end_date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    else:
+        start_date = end_date - timedelta(days=7)  # Default to last 7 days
+    return start_date, end_date
+
 @app.post("/auth/login", response_model=Token)
 async def login(login_data: LoginRequest):
     user = authenticate_user(login_data.username, login_data.password)
@@ -54,29 +106,7 @@ async def get_dashboard_stats(
 ):
     """Get dashboard statistics for the given date range"""
     try:
-        end_date = datetime.utcnow()
-        
-        if range_type == "today":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif range_type == "yesterday":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
-            end_date = start_date + timedelta(days=1)
-        elif range_type == "last7":
-            start_date = end_date - timedelta(days=7)
-        elif range_type == "last30":
-            start_date = end_date - timedelta(days=30)
-        elif range_type == "last90":
-            start_date = end_date - timedelta(days=90)
-        elif range_type == "thisMonth":
-            start_date = end_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        elif range_type == "lastMonth":
-            start_date = (end_date.replace(day=1) - timedelta(days=1)).replace(day=1)
-            end_date = start_date.replace(day=28) + timedelta(days=4)  # Last day of month
-        elif range_type == "thisYear":
-            start_date = end_date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-        else:
-            start_date = end_date - timedelta(days=7)  # Default to last 7 days
-        
+        start_date, end_date = resolve_date_range(range_type)
         stats = db.get_stats(start_date, end_date)
         return StatsResponse(**stats)
     except Exception as e:
@@ -106,6 +136,74 @@ async def get_registration_data(
         logger.error(f"Error getting registration data: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/charts/demographics", response_model=DemographicsResponse)
+async def get_demographics(
+    dimensions: Optional[str] = Query(None, description="Comma-separated dimensions (gender, age, religion, city, language, coins)"),
+    start_date: Optional[datetime] = Query(None, description="Only users created on or after this date"),
+    end_date: Optional[datetime] = Query(None, description="Only users created on or before this date"),
+    is_active: Optional[bool] = Query(None, description="Filter by active status"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get demographic breakdowns for charts in a single aggregation pass"""
+    requested = [d.strip() for d in dimensions.split(",") if d.strip()] if dimensions else list(DEMOGRAPHIC_FACETS)
+    requested = list(dict.fromkeys(requested))
+    unknown = [d for d in requested if d not in DEMOGRAPHIC_FACETS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dimensions: {', '.join(unknown)}")
+    try:
+        data = db.get_demographics(requested, start_date, end_date, is_active)
+        return DemographicsResponse(**data)
+    except Exception as e:
+        logger.error(f"Error getting demographics: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/charts/activity", response_model=ActivityResponse)
+async def get_activity_data(
+    metric: str = Query("messages", description="Activity metric (messages, likes, blocks)"),
+    granularity: str = Query("day", description="Bucket size (hour, day)"),
+    range_type: str = Query("last7", alias="range", description="Date range type"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get messaging and swiping activity from precomputed time buckets"""
+    if metric not in ACTIVITY_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
+    if granularity not in ACTIVITY_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown granularity: {granularity}")
+    try:
+        start_date, end_date = resolve_date_range(range_type)
+        data = db.get_activity_data(metric, granularity, start_date, end_date)
+        return ActivityResponse(**data)
+    except Exception as e:
+        logger.error(f"Error getting activity data: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/charts/retention", response_model=RetentionResponse)
+async def get_retention_data(
+    cohorts: int = Query(12, ge=1, le=104, description="Number of most recent weekly cohorts"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get weekly signup-cohort retention from precomputed counters"""
+    try:
+        matrix = db.get_retention_matrix(cohorts)
+        return RetentionResponse(weeks=RETENTION_WEEKS, cohorts=matrix)
+    except Exception as e:
+        logger.error(f"Error getting retention data: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/charts/revenue", response_model=RevenueResponse)
+async def get_revenue_data(
+    range_type: str = Query("last30", alias="range", description="Date range type"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get revenue, approval turnaround and coin liability from precomputed aggregates"""
+    try:
+        start_date, end_date = resolve_date_range(range_type)
+        data = db.get_revenue_data(start_date, end_date)
+        return RevenueResponse(**data)
+    except Exception as e:
+        logger.error(f"Error getting revenue data: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 # Users endpoints
 @app.get("/users", response_model=List[dict])
 async def get_users(
@@ -128,6 +226,7 @@ async def get_users(
         # Convert ObjectId to string for JSON serialization
         for user in users:
             user["_id"] = str(user["_id"])
+            user["photo_urls"] = [signed_photo_url(file_id, 128) for file_id in user.get("photos", [])]
         return users
     except Exception as e:
         logger.error(f"Error getting users: {e}")
@@ -141,6 +240,7 @@ async def get_user(user_id: int, current_user: dict = Depends(get_current_user))
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         user["_id"] = str(user["_id"])
+        user["photo_urls"] = [signed_photo_url(file_id, 512) for file_id in user.get("photos", [])]
         return user
     except Exception as e:
         logger.error(f"Error getting user: {e}")
@@ -174,6 +274,78 @@ async def delete_user(user_id: int, current_user: dict = Depends(get_current_use
         logger.error(f"Error deleting user: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+# Conversations endpoints
+@app.get("/conversations/{user_a}/{user_b}", response_model=dict)
+async def get_conversation(
+    user_a: int,
+    user_b: int,
+    limit: int = Query(50, ge=1, le=200, description="Number of messages to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get the messages between two users, newest first, one keyset page at a time.
+    
+    Read-only: messages stored without a conversation_key are listed once the
+    background job has keyed them.
+    """
+    before = None
+    if cursor:
+        try:
+            created_at, message_id = cursor.split("|", 1)
+            before = (datetime.fromisoformat(created_at), ObjectId(message_id))
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        messages = db.get_conversation(user_a, user_b, limit, before)
+        next_cursor = None
+        if len(messages) == limit:
+            last = messages[-1]
+            next_cursor = f"{last['created_at'].isoformat()}|{last['_id']}"
+        # Convert ObjectId to string for JSON serialization
+        for message in messages:
+            message["_id"] = str(message["_id"])
+        return {"messages": messages, "next_cursor": next_cursor}
+    except Exception as e:
+        logger.error(f"Error getting conversation: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+# Photos endpoints
+@app.get("/photos/{file_id}")
+async def get_photo(
+    file_id: str,
+    request: Request,
+    size: int = Query(128, description=f"Thumbnail size ({', '.join(map(str, THUMBNAIL_SIZES))})"),
+    expires: Optional[int] = Query(None, description="Expiry of a signed photo URL"),
+    signature: Optional[str] = Query(None, description="Signature of a signed photo URL")
+):
+    """Get a resized user photo thumbnail.
+    
+    Accepts either a Bearer token or the expires/signature pair from the
+    photo_urls returned with users, so the URLs work directly in <img src>.
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail="Unsupported thumbnail size")
+    if signature is not None and expires is not None:
+        if not verify_photo_signature(file_id, size, expires, signature):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired photo URL")
+    else:
+        await get_current_user(request)
+    try:
+        data = await photo_proxy.get_thumbnail(file_id, size)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    except InvalidPhotoError:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Photo is not a supported image")
+    except Exception as e:
+        logger.error(f"Error getting photo: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    # Thumbnails for a file_id never change, so clients may keep them indefinitely
+    return Response(
+        content=data,
+        media_type="image/jpeg",
+        headers={"Cache-Control": "private, max-age=31536000, immutable"}
+    )
+
 # Payments endpoints
 @app.get("/payments", response_model=List[dict])
 async def get_payments(
@@ -257,6 +429,39 @@ async def get_complaints(
         logger.error(f"Error getting complaints: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/complaints/triage", response_model=dict)
+async def get_complaint_triage(
+    limit: int = Query(100, ge=1, le=500, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get pending complaints ordered by the reported user's abuse risk, one keyset page at a time"""
+    after = None
+    if cursor:
+        try:
+            score, created_at, complaint_id = cursor.split("|", 2)
+            after = (float(score), datetime.fromisoformat(created_at), ObjectId(complaint_id))
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        complaints, next_key = db.get_complaint_triage(limit, after)
+        next_cursor = None
+        if next_key:
+            score, created_at, complaint_id = next_key
+            next_cursor = f"{score!r}|{created_at.isoformat()}|{complaint_id}"
+        # Convert ObjectId to string for JSON serialization
+        for complaint in complaints:
+            complaint["_id"] = str(complaint["_id"])
+        # Complaints newer than the last background refresh are not in the queue yet
+        return {
+            "complaints": complaints,
+            "next_cursor": next_cursor,
+            "unscored": db.get_unscored_complaints_count()
+        }
+    except Exception as e:
+        logger.error(f"Error getting complaint triage: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @app.put("/complaints/{complaint_id}")
 async def update_complaint_status(
     complaint_id: str,
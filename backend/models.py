@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
 from datetime import datetime
 from bson import ObjectId
 from pydantic_core import core_schema
@@ -128,6 +128,30 @@ class ChartDataResponse(BaseModel):
     labels: List[str]
     data: List[int]
 
+class DemographicsResponse(BaseModel):
+    dimensions: Dict[str, ChartDataResponse]
+    total_users: int
+
+class ActivityResponse(BaseModel):
+    labels: List[str]
+    datasets: Dict[str, List[int]]
+
+class RetentionCohort(BaseModel):
+    cohort: str
+    size: int
+    retention: List[Optional[float]]
+
+class RetentionResponse(BaseModel):
+    weeks: int
+    cohorts: List[RetentionCohort]
+
+class RevenueResponse(BaseModel):
+    labels: List[str]
+    revenue: Dict[str, List[float]]
+    totals_by_status: Dict[str, Dict[str, float]]
+    turnaround: Dict[str, float]
+    coin_liability: Dict[str, int]
+
 class PaymentUpdateRequest(BaseModel):
     status: str
     admin_notes: Optional[str] = None
@@ -0,0 +1,180 @@
+import abc
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail edge lengths the proxy will produce; keeps the number of cached variants bounded
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+
+class InvalidPhotoError(Exception):
+    """The upstream file is not an image Pillow can read"""
+
+class PhotoSource(abc.ABC):
+    """Upstream the original photos are fetched from"""
+
+    @abc.abstractmethod
+    def fetch(self, file_id: str) -> bytes:
+        """Return the original image bytes, or raise FileNotFoundError"""
+        ...
+
+class LocalPhotoSource(PhotoSource):
+    """Reads originals from a local directory, one file per file_id"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def fetch(self, file_id: str) -> bytes:
+        if os.path.basename(file_id) != file_id or file_id in ("", ".", ".."):
+            raise FileNotFoundError(file_id)
+        with open(os.path.join(self.directory, file_id), "rb") as f:
+            return f.read()
+
+class TelegramPhotoSource(PhotoSource):
+    """Downloads originals through the Telegram Bot API"""
+
+    def __init__(self, token: str):
+        self.api_url = f"https://api.telegram.org/bot{token}"
+        self.file_url = f"https://api.telegram.org/file/bot{token}"
+
+    def fetch(self, file_id: str) -> bytes:
+        try:
+            with urllib.request.urlopen(f"{self.api_url}/getFile?file_id={urllib.parse.quote(file_id)}", timeout=10) as response:
+                result = json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code in (400, 404):
+                raise FileNotFoundError(file_id)
+            raise
+        if not result.get("ok"):
+            raise FileNotFoundError(file_id)
+        with urllib.request.urlopen(f"{self.file_url}/{result['result']['file_path']}", timeout=30) as response:
+            return response.read()
+
+class ThumbnailCache:
+    """Size-bounded on-disk LRU cache of generated thumbnails"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Rebuild recency order from file modification times
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.total_bytes += size
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                self.total_bytes -= self._entries.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        path = os.path.join(self.directory, key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(os.path.join(self.directory, evicted))
+                except FileNotFoundError:
+                    pass
+
+class PhotoProxy:
+    """Serves cached thumbnails, coalescing concurrent misses for the same photo"""
+
+    def __init__(self, source: PhotoSource, cache: ThumbnailCache):
+        self.source = source
+        self.cache = cache
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def cache_key(file_id: str, size: int) -> str:
+        digest = hashlib.sha256(file_id.encode()).hexdigest()
+        return f"{digest}_{size}.jpg"
+
+    def _render(self, file_id: str, size: int, key: str) -> bytes:
+        """Fetch the original, resize it and store the thumbnail (runs in a worker thread)"""
+        original = self.source.fetch(file_id)
+        try:
+            image = Image.open(io.BytesIO(original))
+        except UnidentifiedImageError:
+            raise InvalidPhotoError(file_id)
+        # Apply the EXIF orientation first, or phone photos come out rotated
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=85, optimize=True)
+        data = output.getvalue()
+        self.cache.put(key, data)
+        return data
+
+    async def get_thumbnail(self, file_id: str, size: int) -> bytes:
+        key = self.cache_key(file_id, size)
+        loop = asyncio.get_running_loop()
+        # Cache hits still touch the disk, so keep them off the event loop too
+        data = await loop.run_in_executor(None, self.cache.get, key)
+        if data is not None:
+            return data
+
+        # Another request is already generating this thumbnail; wait for it
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        future = loop.run_in_executor(None, self._render, file_id, size, key)
+        self._inflight[key] = future
+        # Forget the render only when it finishes, even if every waiter was cancelled
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+def create_photo_proxy() -> PhotoProxy:
+    if settings.PHOTO_SOURCE == "telegram":
+        source = TelegramPhotoSource(settings.TELEGRAM_BOT_TOKEN)
+    else:
+        source = LocalPhotoSource(settings.PHOTO_SOURCE_DIR)
+    return PhotoProxy(source, ThumbnailCache(settings.PHOTO_CACHE_DIR, settings.PHOTO_CACHE_MAX_BYTES))
+
+# Global photo proxy instance
+photo_proxy = create_photo_proxy()
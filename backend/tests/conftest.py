@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+import mongomock
+import pymongo
+import pytest
+
+# Run against an in-memory fake MongoDB and keep the photo cache out of the tree
+pymongo.MongoClient = mongomock.MongoClient
+os.environ.setdefault("PHOTO_CACHE_DIR", tempfile.mkdtemp(prefix="photo_cache_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    """A Database backed by a fresh, empty mongomock client"""
+    return Database()
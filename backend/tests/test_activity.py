@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def _hours_ago(hours):
+    return (datetime.utcnow() - timedelta(hours=hours)).replace(minute=30, second=0, microsecond=0)
+
+
+def _bucket_total(database, metric, granularity="day"):
+    return sum(b["count"] for b in database.db.activity_buckets.find({"metric": metric, "granularity": granularity}))
+
+
+def test_events_are_folded_once(database, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "ANALYTICS_LAG_SECONDS", 0)
+    database.db.likes.insert_many([
+        {"user_id": 1, "liked_user_id": 2, "created_at": _hours_ago(30)},
+        {"user_id": 2, "liked_user_id": 1, "created_at": _hours_ago(5)},
+    ])
+    database.refresh_activity_buckets()
+    database.refresh_activity_buckets()
+    assert _bucket_total(database, "likes") == 2
+    assert _bucket_total(database, "likes", "hour") == 2
+
+    database.db.likes.insert_one({"user_id": 3, "liked_user_id": 1, "created_at": datetime.utcnow()})
+    database.refresh_activity_buckets()
+    assert _bucket_total(database, "likes") == 3
+
+
+def test_messages_are_split_by_type(database):
+    database.db.messages.insert_many([
+        {"from_user_id": 1, "to_user_id": 2, "message_type": "text", "created_at": _hours_ago(3)},
+        {"from_user_id": 1, "to_user_id": 2, "message_type": "photo", "created_at": _hours_ago(3)},
+        {"from_user_id": 2, "to_user_id": 1, "message_type": "text", "created_at": _hours_ago(3)},
+    ])
+    database.refresh_activity_buckets()
+
+    now = datetime.utcnow()
+    data = database.get_activity_data("messages", "day", now - timedelta(days=2), now)
+    assert sum(data["datasets"]["text"]) == 2
+    assert sum(data["datasets"]["photo"]) == 1
+    assert len(data["labels"]) == len(data["datasets"]["text"])
+
+
+def test_failed_job_keeps_window_for_retry(database, monkeypatch):
+    database.db.blocks.insert_one({"user_id": 1, "blocked_user_id": 2, "created_at": _hours_ago(4)})
+    buckets = database.db.activity_buckets
+    original = buckets.bulk_write
+
+    def failing_bulk_write(*args, **kwargs):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(buckets, "bulk_write", failing_bulk_write)
+    database.refresh_activity_buckets()
+    assert database.db.analytics_state.find_one({"_id": "activity:blocks"}).get("high_water") is None
+
+    monkeypatch.setattr(buckets, "bulk_write", original)
+    database.refresh_activity_buckets()
+    assert _bucket_total(database, "blocks") == 1
+
+
+def test_recent_events_wait_for_the_lag(database, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "ANALYTICS_LAG_SECONDS", 3600)
+    database.db.likes.insert_one({"user_id": 1, "liked_user_id": 2, "created_at": datetime.utcnow()})
+
+    database.refresh_activity_buckets()
+    assert _bucket_total(database, "likes") == 0
+
+    monkeypatch.setattr(settings, "ANALYTICS_LAG_SECONDS", 0)
+    database.refresh_activity_buckets()
+    assert _bucket_total(database, "likes") == 1
+
+
+def test_leased_job_is_skipped(database):
+    database.db.analytics_state.insert_one({
+        "_id": "activity:likes",
+        "locked_until": datetime.utcnow() + timedelta(minutes=5)
+    })
+    ran = []
+
+    assert database._run_window("activity:likes", lambda lower, upper: ran.append(1)) is False
+    assert ran == []
+
+
+@pytest.mark.parametrize("lease_offset, taken", [(-1, True), (None, True), (5, False)])
+def test_lease_is_taken_only_once_expired_or_released(database, lease_offset, taken):
+    locked_until = datetime.utcnow() + timedelta(minutes=lease_offset) if lease_offset else None
+    database.db.analytics_state.insert_one({"_id": "job", "locked_until": locked_until})
+
+    assert database._run_window("job", lambda lower, upper: None) is taken
+    state = database.db.analytics_state.find_one({"_id": "job"})
+    if taken:
+        assert state["locked_until"] is None and state["high_water"] is not None
+    else:
+        assert state["locked_until"] > datetime.utcnow() and "high_water" not in state
+
+
+def test_partially_applied_window_is_not_counted_twice(database, monkeypatch):
+    database.db.messages.insert_many([
+        {"from_user_id": 1, "to_user_id": 2, "message_type": "text", "created_at": _hours_ago(30)},
+        {"from_user_id": 1, "to_user_id": 2, "message_type": "photo", "created_at": _hours_ago(5)},
+    ])
+    buckets = database.db.activity_buckets
+    original = buckets.bulk_write
+
+    def partial_bulk_write(operations, **kwargs):
+        original(operations[:1], **kwargs)
+        raise RuntimeError("write failed midway")
+
+    monkeypatch.setattr(buckets, "bulk_write", partial_bulk_write)
+    database.refresh_activity_buckets()
+    assert _bucket_total(database, "messages", "hour") == 1
+
+    monkeypatch.setattr(buckets, "bulk_write", original)
+    database.refresh_activity_buckets()
+    assert _bucket_total(database, "messages", "hour") == 2
+    assert _bucket_total(database, "messages") == 2
+
+
+def test_expired_lease_cannot_complete_the_window(database):
+    def job(lower, upper):
+        # Another worker takes over while this one is still running
+        database.db.analytics_state.update_one({"_id": "job"}, {"$set": {"lease": "other", "locked_until": datetime.utcnow()}})
+
+    assert database._run_window("job", job) is False
+    state = database.db.analytics_state.find_one({"_id": "job"})
+    assert state["lease"] == "other" and state["locked_until"] is not None
+    assert "high_water" not in state and state["window_upper"] is not None
+
+
+def test_reads_only_precomputed_buckets(database):
+    database.db.likes.insert_one({"user_id": 1, "liked_user_id": 2, "created_at": _hours_ago(6)})
+    now = datetime.utcnow()
+
+    assert database.get_activity_data("likes", "day", now - timedelta(days=1), now)["datasets"] == {}
+
+    database.refresh_analytics()
+    data = database.get_activity_data("likes", "day", now - timedelta(days=1), now)
+    assert sum(data["datasets"]["all"]) == 1
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from database import conversation_key
+
+
+def _message(from_user_id, to_user_id, minutes):
+    return {
+        "from_user_id": from_user_id,
+        "to_user_id": to_user_id,
+        "message_text": f"message {minutes}",
+        "created_at": datetime(2025, 1, 1) + timedelta(minutes=minutes),
+    }
+
+
+def test_conversation_key_is_order_independent():
+    assert conversation_key(7, 3) == conversation_key(3, 7) == "3:7"
+
+
+def test_backfill_keys_existing_messages(database):
+    database.db.messages.insert_many([_message(1, 2, 0), _message(2, 1, 1), _message(1, 3, 2)])
+
+    assert database.backfill_conversation_keys(batch_size=2) == 3
+    assert database.backfill_conversation_keys() == 0
+    assert database.db.messages.count_documents({"conversation_key": "1:2"}) == 2
+
+
+def test_backfill_moves_past_malformed_messages(database):
+    database.db.messages.insert_one({"from_user_id": 1, "message_text": "no recipient", "created_at": datetime(2025, 1, 1)})
+    database.db.messages.insert_many([_message(1, 2, 0), _message(2, 1, 1), _message(1, 3, 2)])
+
+    assert database.backfill_conversation_keys(batch_size=1) == 4
+    assert database.db.messages.count_documents({"conversation_key": {"$ne": None}}) == 3
+    assert len(database.get_conversation(1, 2)) == 2
+
+
+def test_pages_through_both_directions_by_keyset(database):
+    # Two messages share a timestamp to exercise the _id tie-breaker
+    messages = [_message(1, 2, minute) for minute in range(0, 6, 2)]
+    messages += [_message(2, 1, minute) for minute in range(1, 6, 2)]
+    messages.append(_message(2, 1, 4))
+    messages.append(_message(1, 3, 3))
+    database.db.messages.insert_many(messages)
+    database.backfill_conversation_keys()
+
+    seen = []
+    before = None
+    while True:
+        page = database.get_conversation(2, 1, limit=3, before=before)
+        seen.extend(page)
+        if len(page) < 3:
+            break
+        before = (page[-1]["created_at"], page[-1]["_id"])
+
+    assert len(seen) == 7
+    assert len({m["_id"] for m in seen}) == 7
+    keys = [(m["created_at"], m["_id"]) for m in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_reading_a_conversation_does_not_write(database):
+    database.db.messages.insert_one(_message(1, 2, 0))
+
+    assert database.get_conversation(1, 2) == []
+    assert database.db.messages.count_documents({"conversation_key": {"$exists": True}}) == 0
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+
+def _user(user_id, **fields):
+    return {
+        "user_id": user_id,
+        "username": f"user{user_id}",
+        "first_name": "Test",
+        "is_active": True,
+        "created_at": datetime(2025, 1, 1) + timedelta(days=user_id),
+        **fields,
+    }
+
+
+def test_buckets_keep_not_specified_separate(database):
+    database.db.users.insert_many([
+        _user(1, age=16, coins=0),
+        _user(2, age=30, coins=1500),
+        _user(3, age=None, coins=None),
+        _user(4),
+    ])
+
+    result = database.get_demographics(["age", "coins"])
+
+    age = dict(zip(result["dimensions"]["age"]["labels"], result["dimensions"]["age"]["data"]))
+    coins = dict(zip(result["dimensions"]["coins"]["labels"], result["dimensions"]["coins"]["data"]))
+    assert age == {"Under 18": 1, "25-34": 1, "Not specified": 2}
+    assert coins == {"0": 1, "1000+": 1, "Not specified": 2}
+
+
+def test_duplicate_dimensions_are_counted_once(database):
+    database.db.users.insert_many([_user(1, gender="male"), _user(2, gender="female")])
+
+    result = database.get_demographics(["gender", "gender"])
+
+    assert sorted(result["dimensions"]["gender"]["data"]) == [1, 1]
+    assert result["total_users"] == 2
+
+
+def test_backdated_users_wait_for_cache_expiry(database, monkeypatch):
+    from config import settings
+    database.db.users.insert_many([_user(1, gender="male")])
+    database.get_demographics(["gender"])
+
+    # Inserted after the first call with a created_at far behind the lag
+    database.db.users.insert_one(_user(2, gender="male"))
+    assert database.get_demographics(["gender"])["total_users"] == 1
+
+    monkeypatch.setattr(settings, "DEMOGRAPHICS_CACHE_TTL", -1)
+    result = database.get_demographics(["gender"])
+    assert result["dimensions"]["gender"] == {"labels": ["Male"], "data": [2]}
+    assert result["total_users"] == 2
+
+
+def test_late_inserts_within_the_lag_are_counted_once(database, monkeypatch):
+    from config import settings
+    now = datetime.utcnow()
+    database.db.users.insert_one(_user(1, gender="male", created_at=now - timedelta(minutes=1)))
+    assert database.get_demographics(["gender"])["total_users"] == 1
+
+    # Older created_at than anything seen so far, but still inside the lag
+    database.db.users.insert_one(_user(2, gender="female", created_at=now - timedelta(minutes=2)))
+    assert database.get_demographics(["gender"])["total_users"] == 2
+
+    monkeypatch.setattr(settings, "ANALYTICS_LAG_SECONDS", 0)
+    result = database.get_demographics(["gender"])
+    assert result["total_users"] == 2
+    assert sorted(result["dimensions"]["gender"]["data"]) == [1, 1]
+
+
+def test_cache_is_bounded(database, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "DEMOGRAPHICS_CACHE_SIZE", 2)
+    database.db.users.insert_one(_user(1, gender="male"))
+
+    for day in range(5):
+        database.get_demographics(["gender"], start_date=datetime(2025, 1, 1) + timedelta(days=day))
+
+    assert len(database._demographics_cache) == 2
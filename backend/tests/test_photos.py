@@ -0,0 +1,128 @@
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from auth import signed_photo_url, verify_photo_signature
+from photos import InvalidPhotoError, LocalPhotoSource, PhotoProxy, PhotoSource, ThumbnailCache
+
+
+def _jpeg(width, height, orientation=None):
+    image = Image.new("RGB", (width, height), "red")
+    output = io.BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(output, format="JPEG", exif=exif)
+    else:
+        image.save(output, format="JPEG")
+    return output.getvalue()
+
+
+class CountingSource(PhotoSource):
+    def __init__(self, data, delay=0.0):
+        self.data = data
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, file_id):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return self.data
+
+
+def test_photo_source_is_abstract():
+    with pytest.raises(TypeError):
+        PhotoSource()
+
+
+def test_local_source_rejects_paths(tmp_path):
+    source = LocalPhotoSource(str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        source.fetch("../secret")
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_bytes=25)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    assert cache.get("a") is not None  # "b" is now the oldest
+
+    cache.put("c", b"x" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a", "c"]
+    assert cache.total_bytes == 20
+
+
+def test_cache_is_rebuilt_from_disk(tmp_path):
+    ThumbnailCache(str(tmp_path), max_bytes=100).put("a", b"x" * 10)
+
+    cache = ThumbnailCache(str(tmp_path), max_bytes=100)
+
+    assert cache.total_bytes == 10
+    assert cache.get("a") == b"x" * 10
+
+
+def test_thumbnail_is_resized_and_exif_rotated(tmp_path):
+    # Orientation 6 means the camera stored the image rotated 90 degrees
+    proxy = PhotoProxy(CountingSource(_jpeg(400, 200, orientation=6)), ThumbnailCache(str(tmp_path), 10 ** 6))
+
+    data = asyncio.run(proxy.get_thumbnail("photo", 128))
+
+    assert Image.open(io.BytesIO(data)).size == (64, 128)
+
+
+def test_non_image_is_rejected(tmp_path):
+    proxy = PhotoProxy(CountingSource(b"not an image"), ThumbnailCache(str(tmp_path), 10 ** 6))
+
+    with pytest.raises(InvalidPhotoError):
+        asyncio.run(proxy.get_thumbnail("photo", 64))
+    assert proxy._inflight == {}
+
+
+def test_concurrent_misses_share_one_render(tmp_path):
+    source = CountingSource(_jpeg(300, 300), delay=0.2)
+    proxy = PhotoProxy(source, ThumbnailCache(str(tmp_path), 10 ** 6))
+
+    async def fetch_many():
+        return await asyncio.gather(*(proxy.get_thumbnail("photo", 64) for _ in range(5)))
+
+    results = asyncio.run(fetch_many())
+
+    assert source.calls == 1
+    assert len(set(results)) == 1
+    assert proxy._inflight == {}
+
+
+def test_cancelled_first_request_does_not_restart_render(tmp_path):
+    source = CountingSource(_jpeg(300, 300), delay=0.2)
+    proxy = PhotoProxy(source, ThumbnailCache(str(tmp_path), 10 ** 6))
+
+    async def scenario():
+        first = asyncio.create_task(proxy.get_thumbnail("photo", 64))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.sleep(0)
+        return await proxy.get_thumbnail("photo", 64)
+
+    assert asyncio.run(scenario())
+    assert source.calls == 1
+
+
+def test_signed_photo_urls():
+    url = signed_photo_url("file/1", 128)
+    path, query = url.split("?")
+    params = dict(pair.split("=") for pair in query.split("&"))
+
+    assert path == "/photos/file%2F1"
+    assert verify_photo_signature("file/1", 128, int(params["expires"]), params["signature"])
+    assert not verify_photo_signature("file/1", 512, int(params["expires"]), params["signature"])
+    assert not verify_photo_signature("file/2", 128, int(params["expires"]), params["signature"])
+    assert not verify_photo_signature("file/1", 128, int(time.time()) - 1, params["signature"])
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+import database as database_module
+
+SIGNUP = datetime(2025, 1, 6, 12)  # a Monday
+
+
+def _user(user_id, created_at=SIGNUP):
+    return {"user_id": user_id, "username": f"user{user_id}", "first_name": "Test", "created_at": created_at}
+
+
+def _like(user_id, days_after_signup):
+    return {"user_id": user_id, "liked_user_id": 1000 + days_after_signup, "created_at": SIGNUP + timedelta(days=days_after_signup)}
+
+
+def _message(user_id, days_after_signup):
+    return {"from_user_id": user_id, "to_user_id": 999, "created_at": SIGNUP + timedelta(days=days_after_signup)}
+
+
+def _cohort(database):
+    return database.db.cohort_retention.find_one({"_id": datetime(2025, 1, 6)})
+
+
+def test_user_active_through_both_events_is_counted_once(database):
+    database.db.users.insert_many([_user(1), _user(2)])
+    database.db.messages.insert_one(_message(1, 8))
+    database.db.likes.insert_many([_like(1, 9), _like(2, 15), _like(2, 0)])
+
+    database.refresh_retention()
+
+    cohort = _cohort(database)
+    assert cohort["size"] == 2
+    assert cohort["weeks"] == {"1": 1, "2": 1}
+
+    matrix = database.get_retention_matrix(1)
+    assert matrix[0]["cohort"] == "2025-01-06"
+    assert matrix[0]["retention"][:3] == [50.0, 50.0, 0.0]
+
+
+def test_refolding_a_week_does_not_double_count(database):
+    database.db.users.insert_one(_user(1))
+    database.refresh_retention()
+    week = datetime(2025, 1, 13)
+
+    database._mark_active({1: {week}})
+    database._mark_active({1: {week}})
+
+    assert _cohort(database)["weeks"] == {"1": 1}
+
+
+def test_lost_compare_and_swap_is_not_counted(database, monkeypatch):
+    database.db.users.insert_one(_user(1))
+    database.refresh_retention()
+    cohorts = database.db.user_cohorts
+    stale = cohorts.find_one({"_id": 1})
+    # Another worker sets the week 1 bit after this one has read the document
+    cohorts.update_one({"_id": 1}, {"$set": {"active_weeks": 1 << 1}})
+    original_find = cohorts.find
+    calls = []
+
+    def stale_first_find(*args, **kwargs):
+        calls.append(1)
+        return iter([stale]) if len(calls) == 1 else original_find(*args, **kwargs)
+
+    monkeypatch.setattr(cohorts, "find", stale_first_find)
+
+    database._mark_active({1: {datetime(2025, 1, 13)}})
+
+    assert (_cohort(database) or {}).get("weeks") is None
+    assert cohorts.find_one({"_id": 1})["active_weeks"] == 1 << 1
+
+
+def test_activity_from_user_without_cohort_assigns_one(database):
+    database.db.users.insert_one(_user(1))
+    database.db.likes.insert_one(_like(1, 10))
+
+    database._fold_retention(("likes", "$user_id"), None, datetime.utcnow())
+
+    assert database.db.user_cohorts.find_one({"_id": 1})["cohort"] == datetime(2025, 1, 6)
+    assert _cohort(database)["size"] == 1
+    assert _cohort(database)["weeks"] == {"1": 1}
+
+    # The later cohort pass must not count the user a second time
+    database.refresh_retention()
+    assert _cohort(database)["size"] == 1
+
+
+def test_users_are_processed_in_batches(database, monkeypatch):
+    monkeypatch.setattr(database_module, "RETENTION_BATCH_SIZE", 2)
+    database.db.users.insert_many([_user(i) for i in range(1, 6)])
+    database.db.likes.insert_many([_like(i, 8) for i in range(1, 6)])
+
+    database.refresh_retention()
+
+    assert _cohort(database)["size"] == 5
+    assert _cohort(database)["weeks"] == {"1": 5}
+
+
+def test_failed_size_update_is_recovered(database, monkeypatch):
+    database.db.users.insert_one(_user(1))
+    retention = database.db.cohort_retention
+    original = retention.update_one
+
+    def failing_update_one(*args, **kwargs):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(retention, "update_one", failing_update_one)
+    database.refresh_retention()
+    assert database.db.user_cohorts.count_documents({}) == 1
+    assert _cohort(database) is None
+
+    monkeypatch.setattr(retention, "update_one", original)
+    database.refresh_retention()
+    database.refresh_retention()
+    assert _cohort(database)["size"] == 1
+
+
+def test_failed_week_update_is_retried(database, monkeypatch):
+    database.db.users.insert_one(_user(1))
+    database.db.likes.insert_one(_like(1, 8))
+    retention = database.db.cohort_retention
+    original = retention.update_one
+
+    def failing_week_update(filter, update, **kwargs):
+        if any(field.startswith("weeks.") for field in update.get("$inc", {})):
+            raise RuntimeError("write failed")
+        return original(filter, update, **kwargs)
+
+    monkeypatch.setattr(retention, "update_one", failing_week_update)
+    database.refresh_retention()
+    assert database.db.user_cohorts.find_one({"_id": 1})["active_weeks"] == 0
+
+    monkeypatch.setattr(retention, "update_one", original)
+    database.refresh_retention()
+    assert _cohort(database)["weeks"] == {"1": 1}
+    assert _cohort(database)["size"] == 1
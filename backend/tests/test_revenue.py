@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+
+
+def _payment(package_name="Gold", price=10.0, coins=100, status="pending", days_ago=1):
+    return {
+        "user_id": 1,
+        "package_name": package_name,
+        "coins_amount": coins,
+        "price": price,
+        "status": status,
+        "screenshot_file_id": "file",
+        "created_at": datetime.utcnow() - timedelta(days=days_ago),
+    }
+
+
+def _summary(database):
+    totals = {}
+    for doc in database.db.revenue_daily.find():
+        status = totals.setdefault(doc["status"], {"count": 0, "revenue": 0.0, "coins": 0})
+        for field in status:
+            status[field] += doc[field]
+    return totals
+
+
+def test_payments_are_folded_once(database):
+    database.db.payments.insert_many([_payment(), _payment(status="approved", price=5.0, coins=50)])
+
+    database.refresh_revenue()
+    database.refresh_revenue()
+
+    summary = _summary(database)
+    assert summary["pending"]["count"] == 1
+    assert summary["approved"]["revenue"] == 5.0
+
+
+def test_approval_moves_payment_between_statuses(database):
+    payment_id = database.db.payments.insert_one(_payment(days_ago=2)).inserted_id
+    database.refresh_revenue()
+
+    assert database.update_payment_status(str(payment_id), "approved", 1)
+
+    summary = _summary(database)
+    assert summary["pending"]["count"] == 0
+    assert summary["approved"] == {"count": 1, "revenue": 10.0, "coins": 100}
+    turnaround = database.db.revenue_turnaround.find_one({"status": "approved"})
+    assert turnaround["count"] == 1
+    assert 47 * 3600 < turnaround["total_seconds"] < 49 * 3600
+
+
+def test_unfolded_payment_never_goes_negative(database):
+    payment_id = database.db.payments.insert_one(_payment()).inserted_id
+
+    # Approved before the background fold ever saw it
+    assert database.update_payment_status(str(payment_id), "approved", 1)
+    database.refresh_revenue()
+
+    summary = _summary(database)
+    assert "pending" not in summary or summary["pending"]["count"] == 0
+    assert summary["approved"]["count"] == 1
+
+
+def test_revenue_report_reads_aggregates(database):
+    database.db.payments.insert_many([
+        _payment(status="approved", price=10.0),
+        _payment(package_name="Silver", status="approved", price=4.0, coins=40),
+        _payment(coins=30),
+    ])
+    database.refresh_revenue()
+    now = datetime.utcnow()
+
+    data = database.get_revenue_data(now - timedelta(days=7), now)
+
+    assert sum(data["revenue"]["Gold"]) == 10.0
+    assert sum(data["revenue"]["Silver"]) == 4.0
+    assert data["totals_by_status"]["pending"]["count"] == 1
+    assert data["coin_liability"] == {"pending_coins": 30, "issued_coins": 140}
+
+
+def test_failed_aggregate_write_is_retried(database, monkeypatch):
+    database.db.payments.insert_one(_payment(status="approved"))
+    daily = database.db.revenue_daily
+    original = daily.update_one
+
+    def failing_update_one(*args, **kwargs):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(daily, "update_one", failing_update_one)
+    database.refresh_revenue()
+    assert _summary(database) == {}
+
+    monkeypatch.setattr(daily, "update_one", original)
+    database.refresh_revenue()
+    database.refresh_revenue()
+    assert _summary(database)["approved"]["count"] == 1
+
+
+def test_failed_transition_is_finished_by_the_fold(database, monkeypatch):
+    payment_id = database.db.payments.insert_one(_payment()).inserted_id
+    database.refresh_revenue()
+    daily = database.db.revenue_daily
+    original = daily.update_one
+    calls = []
+
+    def fail_second_write(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("write failed")
+        return original(*args, **kwargs)
+
+    # Removing from pending succeeds, adding to approved fails
+    monkeypatch.setattr(daily, "update_one", fail_second_write)
+    assert database.update_payment_status(str(payment_id), "approved", 1)
+    monkeypatch.setattr(daily, "update_one", original)
+    database.refresh_revenue()
+
+    summary = _summary(database)
+    assert summary["pending"]["count"] == 0
+    assert summary["approved"]["count"] == 1
+    assert database.db.revenue_turnaround.find_one({"status": "approved"})["count"] == 1
+
+
+def test_fold_records_turnaround_of_processed_payments(database):
+    created_at = datetime.utcnow() - timedelta(days=3)
+    database.db.payments.insert_one({
+        **_payment(status="approved"),
+        "created_at": created_at,
+        "processed_at": created_at + timedelta(hours=6),
+    })
+
+    database.refresh_revenue()
+    database.refresh_revenue()
+    now = datetime.utcnow()
+
+    turnaround = database.get_revenue_data(now - timedelta(days=7), now)["turnaround"]
+    assert turnaround == {"count": 1, "avg_hours": 6.0, "max_hours": 6.0}
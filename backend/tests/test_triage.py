@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+from database import current_risk, RISK_HALF_LIFE_DAYS
+
+NOW = datetime(2025, 6, 1)
+
+
+def _complaint(user_id, reported_user_id, days_ago, status="pending"):
+    return {
+        "user_id": user_id,
+        "reported_user_id": reported_user_id,
+        "complaint_type": "spam",
+        "complaint_text": "spam",
+        "status": status,
+        "created_at": NOW - timedelta(days=days_ago),
+    }
+
+
+def _all_pages(database, limit):
+    complaints, after = [], None
+    while True:
+        page, after = database.get_complaint_triage(limit, after)
+        complaints.extend(page)
+        if after is None:
+            return complaints
+
+
+def test_recent_reports_outrank_old_ones(database):
+    database.db.complaints.insert_many([
+        _complaint(1, 100, days_ago=90),
+        _complaint(2, 100, days_ago=90),
+        _complaint(3, 200, days_ago=1),
+        _complaint(4, None, days_ago=0),
+    ])
+    database.refresh_risk_scores()
+
+    complaints, _ = database.get_complaint_triage()
+
+    assert [c.get("reported_user_id") for c in complaints] == [200, 100, 100, None]
+    assert complaints[0]["reported_complaints"] == 1
+    assert complaints[1]["reported_complaints"] == 2
+    assert complaints[-1]["risk_score"] == 0.0
+
+
+def test_blocks_add_to_risk(database):
+    database.db.complaints.insert_many([_complaint(1, 100, 5), _complaint(2, 200, 5)])
+    database.db.blocks.insert_one({"user_id": 3, "blocked_user_id": 200, "created_at": NOW - timedelta(days=5)})
+    database.refresh_risk_scores()
+
+    complaints, _ = database.get_complaint_triage()
+
+    assert complaints[0]["reported_user_id"] == 200
+    assert complaints[0]["reported_blocks"] == 1
+
+
+def test_refresh_is_incremental(database):
+    database.db.complaints.insert_one(_complaint(1, 100, 3))
+    database.refresh_risk_scores()
+    database.refresh_risk_scores()
+
+    assert database.db.user_risk.find_one({"_id": 100})["complaints"] == 1
+
+
+def test_keyset_pages_cover_queue_once_in_order(database):
+    # Several complaints per reported user share a risk score; created_at and _id break ties
+    database.db.complaints.insert_many(
+        [_complaint(i, 100 + i % 3, days_ago=i % 2) for i in range(10)]
+        + [_complaint(99, 100, days_ago=0, status="resolved")]
+    )
+    database.refresh_risk_scores()
+
+    expected, _ = database.get_complaint_triage(100)
+    paged = _all_pages(database, 3)
+
+    assert [c["_id"] for c in paged] == [c["_id"] for c in expected]
+    assert len(paged) == 10
+
+
+def test_current_risk_halves_every_half_life():
+    stored = 8.0
+    later = datetime(2024, 1, 1) + timedelta(days=RISK_HALF_LIFE_DAYS)
+    assert current_risk(stored, later) == 4.0
+
+
+def test_failed_copy_is_retried_without_adding_again(database, monkeypatch):
+    database.db.complaints.insert_one(_complaint(1, 100, 3))
+    complaints = database.db.complaints
+    original = complaints.bulk_write
+
+    def failing_bulk_write(*args, **kwargs):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(complaints, "bulk_write", failing_bulk_write)
+    database.refresh_risk_scores()
+    monkeypatch.setattr(complaints, "bulk_write", original)
+    database.refresh_risk_scores()
+
+    assert database.db.user_risk.find_one({"_id": 100})["complaints"] == 1
+    assert complaints.find_one({"reported_user_id": 100})["risk_score"] == database.db.user_risk.find_one({"_id": 100})["score"]
+
+
+def test_new_complaints_get_a_provisional_key(database, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "ANALYTICS_LAG_SECONDS", 3600)
+    database.db.complaints.insert_one(_complaint(1, 100, 3))
+    database.refresh_risk_scores()
+    known = database.db.user_risk.find_one({"_id": 100})["score"]
+
+    # Inside the lag, so not folded yet
+    now = datetime.utcnow()
+    database.db.complaints.insert_many([
+        {**_complaint(2, 100, 0), "created_at": now},
+        {**_complaint(3, 300, 0), "created_at": now},
+    ])
+    assert database.get_unscored_complaints_count() == 2
+
+    database.refresh_risk_scores()
+
+    assert database.get_unscored_complaints_count() == 0
+    assert database.db.complaints.find_one({"user_id": 2})["risk_score"] == known
+    assert database.db.complaints.find_one({"user_id": 3})["risk_score"] == 0.0
+    complaints, _ = database.get_complaint_triage()
+    assert len(complaints) == 3
+    assert database.db.user_risk.find_one({"_id": 100})["complaints"] == 1
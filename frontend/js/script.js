@@ -27,6 +27,28 @@ const PAGINATION_CONFIG = {
     }
 };
 
+// Client-side response cache settings
+const CACHE_CONFIG = {
+    maxEntries: 100,
+    defaultTtl: 30 * 1000,
+    // TTL per endpoint prefix, in milliseconds
+    ttl: {
+        '/dashboard/stats': 60 * 1000,
+        '/charts/': 5 * 60 * 1000,
+        '/users': 30 * 1000,
+        '/payments': 15 * 1000,
+        '/complaints': 15 * 1000
+    }
+};
+
+const SEARCH_DEBOUNCE_MS = 300;
+
+// LRU response cache keyed by endpoint + query string. A Map keeps insertion
+// order, so re-inserting on every hit moves the entry to the most-recent end.
+const apiCache = new Map();
+const inflightRequests = new Map();
+const apiCacheStats = { hits: 0, misses: 0, requests: 0 };
+
 // API Helper Functions
 async function apiRequest(endpoint, options = {}) {
     const url = `${API_BASE_URL}${endpoint}`;
@@ -44,6 +66,7 @@ async function apiRequest(endpoint, options = {}) {
     }
 
     try {
+        apiCacheStats.requests++;
         const response = await fetch(url, config);
 
         if (response.status === 401) {
@@ -58,11 +81,97 @@ async function apiRequest(endpoint, options = {}) {
 
         return await response.json();
     } catch (error) {
-        console.error('API request failed:', error);
+        if (error.name !== 'AbortError') {
+            console.error('API request failed:', error);
+        }
         throw error;
     }
 }
 
+// Resolve the TTL for an endpoint from the longest matching prefix
+function getCacheTtl(endpoint) {
+    let ttl = CACHE_CONFIG.defaultTtl;
+    let matched = '';
+    Object.keys(CACHE_CONFIG.ttl).forEach(prefix => {
+        if (endpoint.startsWith(prefix) && prefix.length > matched.length) {
+            matched = prefix;
+            ttl = CACHE_CONFIG.ttl[prefix];
+        }
+    });
+    return ttl;
+}
+
+// GET with LRU caching and in-flight request sharing
+async function cachedApiRequest(endpoint, options = {}) {
+    const entry = apiCache.get(endpoint);
+    if (entry && entry.expiresAt > Date.now()) {
+        apiCache.delete(endpoint);
+        apiCache.set(endpoint, entry);
+        apiCacheStats.hits++;
+        return entry.data;
+    }
+    if (entry) {
+        apiCache.delete(endpoint);
+    }
+
+    // Reuse a request already on the wire (e.g. a prefetch) for the same key
+    if (inflightRequests.has(endpoint)) {
+        apiCacheStats.hits++;
+        return inflightRequests.get(endpoint);
+    }
+
+    apiCacheStats.misses++;
+    const request = apiRequest(endpoint, options)
+        .then(data => {
+            if (data !== undefined) {
+                apiCache.set(endpoint, { data, expiresAt: Date.now() + getCacheTtl(endpoint) });
+                while (apiCache.size > CACHE_CONFIG.maxEntries) {
+                    apiCache.delete(apiCache.keys().next().value);
+                }
+            }
+            return data;
+        })
+        .finally(() => {
+            inflightRequests.delete(endpoint);
+        });
+
+    inflightRequests.set(endpoint, request);
+    return request;
+}
+
+// Summarise cache effectiveness for the session (also available as window.apiCacheStats)
+function logApiCacheStats() {
+    const lookups = apiCacheStats.hits + apiCacheStats.misses;
+    const hitRate = lookups ? Math.round((apiCacheStats.hits / lookups) * 100) : 0;
+    console.info(
+        `API cache: ${apiCacheStats.hits} hits, ${apiCacheStats.misses} misses (${hitRate}% hit rate), ` +
+        `${apiCacheStats.requests} network requests`
+    );
+}
+
+window.apiCacheStats = apiCacheStats;
+window.addEventListener('pagehide', logApiCacheStats);
+
+// Run a callback when the browser is idle (falls back to a short timeout)
+function runWhenIdle(callback) {
+    if ('requestIdleCallback' in window) {
+        window.requestIdleCallback(callback, { timeout: 2000 });
+    } else {
+        setTimeout(callback, 200);
+    }
+}
+
+// Warm the cache with the page after the current one
+function prefetchNextPage(type, currentCount) {
+    const config = PAGINATION_CONFIG[type];
+    if (currentCount < config.itemsPerPage) return;
+
+    const endpoint = buildListEndpoint(type, config.currentPage + 1);
+    runWhenIdle(() => {
+        cachedApiRequest(endpoint).catch(() => {});
+    });
+}
+
 // Authentication check
 function checkAuth() {
     const isAuthenticated = localStorage.getItem('adminAuthenticated');
@@ -146,13 +255,19 @@ function setupEventListeners() {
     });
 
     // User search
+    let searchDebounceTimer = null;
     document.getElementById('user-search').addEventListener('input', function () {
-        PAGINATION_CONFIG.users.searchTerm = this.value;
-        PAGINATION_CONFIG.users.currentPage = 1;
-        loadUsers();
+        const searchTerm = this.value;
+        clearTimeout(searchDebounceTimer);
+        searchDebounceTimer = setTimeout(() => {
+            PAGINATION_CONFIG.users.searchTerm = searchTerm;
+            PAGINATION_CONFIG.users.currentPage = 1;
+            loadUsers();
+        }, SEARCH_DEBOUNCE_MS);
     });
 
     document.getElementById('search-users-btn').addEventListener('click', function () {
+        clearTimeout(searchDebounceTimer);
         const searchTerm = document.getElementById('user-search').value;
         PAGINATION_CONFIG.users.searchTerm = searchTerm;
         PAGINATION_CONFIG.users.currentPage = 1;
@@ -185,7 +300,7 @@ async function initDashboard() {
 // Update statistics cards with period comparison
 async function updateStats(dateRange) {
     try {
-        const stats = await apiRequest(`/dashboard/stats?range_type=${dateRange}`);
+        const stats = await cachedApiRequest(`/dashboard/stats?range_type=${dateRange}`);
 
         document.getElementById('total-users').textContent = stats.total_users.toLocaleString();
         document.getElementById('active-users').textContent = stats.active_users.toLocaleString();
@@ -244,18 +359,44 @@ function toggleTheme(isDark) {
     renderCharts();
 }
 
+// Build the list endpoint for a table page
+function buildListEndpoint(type, page) {
+    const config = PAGINATION_CONFIG[type];
+    const skip = (page - 1) * config.itemsPerPage;
+
+    let endpoint = `/${type}?skip=${skip}&limit=${config.itemsPerPage}`;
+    if (type === 'users' && config.searchTerm) {
+        endpoint += `&search=${encodeURIComponent(config.searchTerm)}`;
+    } else if (type !== 'users' && config.statusFilter !== 'all') {
+        endpoint += `&status_filter=${config.statusFilter}`;
+    }
+    return endpoint;
+}
+
 // Load users with pagination
+let usersAbortController = null;
+let usersRequestEndpoint = null;
+
 async function loadUsers() {
+    const config = PAGINATION_CONFIG.users;
+    const endpoint = buildListEndpoint('users', config.currentPage);
+
+    // Cancel the previous (now stale) users request, e.g. an older search term
+    if (usersAbortController && usersRequestEndpoint !== endpoint) {
+        usersAbortController.abort();
+        usersAbortController = null;
+    }
+    if (!usersAbortController) {
+        usersAbortController = new AbortController();
+    }
+    usersRequestEndpoint = endpoint;
+    const { signal } = usersAbortController;
+
     try {
-        const config = PAGINATION_CONFIG.users;
         const skip = (config.currentPage - 1) * config.itemsPerPage;
 
-        let endpoint = `/users?skip=${skip}&limit=${config.itemsPerPage}`;
-        if (config.searchTerm) {
-            endpoint += `&search=${encodeURIComponent(config.searchTerm)}`;
-        }
-
-        const users = await apiRequest(endpoint);
+        const users = await cachedApiRequest(endpoint, { signal });
+        if (signal.aborted || usersRequestEndpoint !== endpoint) return;
         config.currentData = users;
 
         // For demo, if API doesn't return total count, estimate it
@@ -266,7 +407,9 @@ async function loadUsers() {
         renderUsersTable(users);
         renderPagination('users', config);
         updatePaginationInfo('users', config, users.length);
+        prefetchNextPage('users', users.length);
     } catch (error) {
+        if (error.name === 'AbortError') return;
         console.error('Error loading users:', error);
         showError('Failed to load users');
     }
@@ -306,12 +449,7 @@ async function loadPayments() {
         const config = PAGINATION_CONFIG.payments;
         const skip = (config.currentPage - 1) * config.itemsPerPage;
 
-        let endpoint = `/payments?skip=${skip}&limit=${config.itemsPerPage}`;
-        if (config.statusFilter !== 'all') {
-            endpoint += `&status_filter=${config.statusFilter}`;
-        }
-
-        const payments = await apiRequest(endpoint);
+        const payments = await cachedApiRequest(buildListEndpoint('payments', config.currentPage));
         config.currentData = payments;
         config.totalItems = payments.length < config.itemsPerPage ?
             skip + payments.length :
@@ -320,6 +458,7 @@ async function loadPayments() {
         renderPaymentsTable(payments);
         renderPagination('payments', config);
         updatePaginationInfo('payments', config, payments.length);
+        prefetchNextPage('payments', payments.length);
     } catch (error) {
         console.error('Error loading payments:', error);
         showError('Failed to load payments');
@@ -359,12 +498,7 @@ async function loadComplaints() {
         const config = PAGINATION_CONFIG.complaints;
         const skip = (config.currentPage - 1) * config.itemsPerPage;
 
-        let endpoint = `/complaints?skip=${skip}&limit=${config.itemsPerPage}`;
-        if (config.statusFilter !== 'all') {
-            endpoint += `&status_filter=${config.statusFilter}`;
-        }
-
-        const complaints = await apiRequest(endpoint);
+        const complaints = await cachedApiRequest(buildListEndpoint('complaints', config.currentPage));
         config.currentData = complaints;
         config.totalItems = complaints.length < config.itemsPerPage ?
             skip + complaints.length :
@@ -373,6 +507,7 @@ async function loadComplaints() {
         renderComplaintsTable(complaints);
         renderPagination('complaints', config);
         updatePaginationInfo('complaints', config, complaints.length);
+        prefetchNextPage('complaints', complaints.length);
     } catch (error) {
         console.error('Error loading complaints:', error);
         showError('Failed to load complaints');
@@ -484,7 +619,7 @@ async function renderCharts(dateRange = 'last7') {
 // Render gender distribution chart
 async function renderGenderChart(dateRange = 'all') {
     try {
-        const data = await apiRequest('/charts/gender-distribution');
+        const data = await cachedApiRequest('/charts/gender-distribution');
 
         const genderCtx = document.getElementById('genderChart').getContext('2d');
 
@@ -524,7 +659,7 @@ async function renderGenderChart(dateRange = 'all') {
 async function renderRegistrationChart(dateRange = 'last7') {
     try {
         const days = dateRange === 'last30' ? 30 : dateRange === 'last90' ? 90 : 7;
-        const data = await apiRequest(`/charts/registrations?days=${days}`);
+        const data = await cachedApiRequest(`/charts/registrations?days=${days}`);
 
         const regCtx = document.getElementById('registrationChart').getContext('2d');
 